@@ -0,0 +1,224 @@
+# Scenario benchmarks for run3.py. Each scenario is a seeded game driven by scripted
+# inputs for a fixed number of ticks, drawn every tick to an off-screen surface.
+#
+#   python bench.py                          # run every scenario, print JSON
+#   python bench.py idle meteor_storm        # just these
+#   python bench.py --output baseline.json   # save the results
+#   python bench.py --compare baseline.json  # exit 1 if anything got slower
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import multiprocessing
+
+import numpy as np
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")  # Keep stdout clean JSON
+import run3
+
+BENCH_SEED = 1234
+REGRESSION_THRESHOLD = 0.10  # Allowed slowdown before compare mode flags a scenario
+# Metrics compare mode checks, and whether a bigger number is worse
+COMPARED_METRICS = (("fps", False), ("frame_ms.p50", True), ("frame_ms.p95", True), ("frame_ms.p99", True),
+                    ("peak_rss_kb", True))
+
+class Scenario:
+    # Plain endless running. Subclasses change the setup or the inputs.
+    ticks = 3600
+    fx_density = run3.FX_DENSITY
+
+    def setup(self, game):
+        # An invulnerable player keeps the whole run in play instead of on the game over screen
+        game.player.invulnerable = True
+
+    def inputs(self, game, tick):
+        # (held, pressed) input bits for this tick, as Game.step takes them
+        return 0, 0
+
+class Idle(Scenario):
+    pass
+
+class BulletHell(Scenario):
+    # A screen full of monsters firing four times as often as usual
+    monsters = 60
+    shoot_delay = 30
+
+    def setup(self, game):
+        super().setup(game)
+        run3.Monster.shoot_delay = self.shoot_delay  # Each scenario runs in its own process
+        self.rng = np.random.default_rng(game.seed)
+        self.next_x = game.camera_x
+
+    def inputs(self, game, tick):
+        # Keep the monster count topped up across the next two screens, left to right
+        added = False
+        while len(game.monsters) < self.monsters:
+            self.next_x = max(self.next_x, game.camera_x) + run3.WIDTH * 2 // self.monsters
+            y = int(self.rng.integers(50, run3.HEIGHT - 150))
+            monster = run3.Monster(self.next_x, y)
+            monster.shoot_cooldown = int(self.rng.integers(0, self.shoot_delay))
+            game.monsters.append(monster)
+            added = True
+        if added:
+            game.monsters.sort(key=lambda monster: monster.x)
+        return 0, 0
+
+class MeteorStorm(Scenario):
+    # Eight meteorites every 100 ms and eight shooting stars every 200 ms
+    fx_density = 8
+
+    def setup(self, game):
+        super().setup(game)
+        game.meteorite_delay = 100
+        game.shooting_star_delay = 200
+
+class DashSpam(Scenario):
+    # Dashing and jumping as often as allowed while flooding the effects layer
+    flood = 20
+
+    def inputs(self, game, tick):
+        player = game.player
+        game.particle_system.emit(self.flood, player.x + player.width // 2, player.y + player.height // 2,
+                                  30, vx=np.linspace(-3, 3, self.flood), vy=np.linspace(-3, 3, self.flood)[::-1],
+                                  size=3, color=tick % len(game.particle_system.palette))
+        held = run3.INPUT_RIGHT if tick // 90 % 2 else run3.INPUT_LEFT
+        pressed = run3.INPUT_LSHIFT
+        if tick % 12 == 0:
+            pressed |= run3.INPUT_SPACE
+        return held, pressed
+
+class LongSession(Scenario):
+    # Ten minutes of play, to catch anything that grows with the length of a run
+    ticks = 10 * 60 * run3.TICK_RATE
+
+SCENARIOS = {
+    "idle": Idle,
+    "bullet_hell": BulletHell,
+    "meteor_storm": MeteorStorm,
+    "dash_spam": DashSpam,
+    "long_session": LongSession,
+}
+
+def peak_rss_kb():
+    # Peak resident memory of this process, None where the platform can't say
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak  # macOS reports bytes
+
+def run_scenario(name, seed=BENCH_SEED, tick_scale=1.0, dirty_rects=False):
+    scenario = SCENARIOS[name]()
+    run3.init(headless=True)
+    game = run3.Game(headless=True, seed=seed, fx_density=scenario.fx_density, level_thread=False)
+    game.use_dirty_rects = dirty_rects
+    scenario.setup(game)
+    target = run3.pygame.Surface((run3.WIDTH, run3.HEIGHT))
+    ticks = max(1, int(scenario.ticks * tick_scale))
+    frame_times = np.empty(ticks)
+    start = time.perf_counter()
+    for tick in range(ticks):
+        frame_start = time.perf_counter()
+        held, pressed = scenario.inputs(game, tick)
+        game.step(held, pressed)
+        game.draw(target)
+        frame_times[tick] = time.perf_counter() - frame_start
+    elapsed = time.perf_counter() - start
+    game.close()
+    frame_ms = frame_times * 1000
+    p50, p95, p99 = np.percentile(frame_ms, (50, 95, 99))
+    cache_stats = run3.sprite_cache.stats()
+    return {
+        "ticks": ticks,
+        "seconds": round(elapsed, 3),
+        "fps": round(ticks / elapsed, 1),
+        "frame_ms": {
+            "mean": round(float(frame_ms.mean()), 4),
+            "p50": round(float(p50), 4),
+            "p95": round(float(p95), 4),
+            "p99": round(float(p99), 4),
+            "max": round(float(frame_ms.max()), 4),
+        },
+        "peak_rss_kb": peak_rss_kb(),
+        "sprite_cache": dict(cache_stats, hit_rate=round(cache_stats["hit_rate"], 4)),
+        "final": {"score": game.score, "camera": game.camera_x, "monsters": len(game.monsters)},
+    }
+
+def run_isolated(name, seed, tick_scale, dirty_rects):
+    # A fresh interpreter per scenario, so caches warmed and memory used by one scenario
+    # don't show up in the next one's numbers
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1) as pool:
+        return pool.apply(run_scenario, (name, seed, tick_scale, dirty_rects))
+
+def metric(results, path):
+    value = results
+    for key in path.split("."):
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+def compare(baseline, current, threshold=REGRESSION_THRESHOLD):
+    # Lines describing every metric that got worse than the baseline by more than threshold
+    regressions = []
+    for name, results in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        for path, higher_is_worse in COMPARED_METRICS:
+            old, new = metric(base, path), metric(results, path)
+            if not old or new is None:
+                continue
+            change = (new - old) / old if higher_is_worse else (old - new) / old
+            if change > threshold:
+                regressions.append(f"{name} {path}: {old} -> {new} ({change:+.0%} worse)")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Run 3 scenario benchmarks")
+    parser.add_argument("scenarios", nargs="*", metavar="SCENARIO",
+                        help=f"scenarios to run, default all of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--seed", type=int, default=BENCH_SEED, help="seed every scenario uses")
+    parser.add_argument("--tick-scale", type=float, default=1.0, help="multiply every scenario's length by this")
+    parser.add_argument("--dirty-rects", action="store_true", help="draw with the dirty-rectangle renderer")
+    parser.add_argument("--output", metavar="FILE", help="write the results here as well as printing them")
+    parser.add_argument("--compare", metavar="BASELINE", help="flag regressions against a saved results file")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="fraction a metric may get worse by before it counts as a regression")
+    args = parser.parse_args()
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name!r}, choose from {', '.join(SCENARIOS)}")
+
+    results = {
+        "seed": args.seed,
+        "tick_scale": args.tick_scale,
+        "dirty_rects": args.dirty_rects,
+        "python": platform.python_version(),
+        "pygame": run3.pygame.version.ver,
+        "numpy": np.__version__,
+        "scenarios": {},
+    }
+    for name in args.scenarios or SCENARIOS:
+        print(f"running {name}...", file=sys.stderr)
+        results["scenarios"][name] = run_isolated(name, args.seed, args.tick_scale, args.dirty_rects)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(baseline, results, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("no regressions", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,27 @@
+import time
+IMPORT_STARTED = time.perf_counter()  # Start of the import phase in the startup report
+
 import pygame
 import random
 import math
-
-# Initialize Pygame
-pygame.init()
-pygame.mixer.init()  # Initialize the mixer module
+import os
+import sys
+import struct
+import argparse
+import threading
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+from queue import Queue, Empty, Full
+import numpy as np
 
 # Constants
 WIDTH, HEIGHT = 800, 600
-FPS = 60
+# Simulation steps per second. Not a tuning knob: speeds, cooldowns, lifetimes and trail
+# lengths are all counted in ticks and were set for 60 of them a second.
+TICK_RATE = 60
+FPS = 240  # Render cap, frames in between ticks are interpolated
+MAX_CATCH_UP_TICKS = 5  # Ticks run per frame at most before the game slows down instead
 GRAVITY = 0.5
 JUMP_FORCE = -12
 MOVE_SPEED = 5
@@ -23,8 +36,60 @@ COMBO_MULTIPLIER = 0.2  # Score multiplier per combo
 MAX_COMBO = 10
 COMBO_DECAY = 1  # Points lost per frame
 POWERUP_DURATION = 300  # 5 seconds at 60 FPS
-SPACESHIP_SPEED = 15  # Increased from 10
-SPACESHIP_DISTANCE = 800  # Increased from 500
+SPACESHIP_SPEED = 10  # Pixels a boarded spaceship flies per tick
+SPACESHIP_DISTANCE = 500  # How far a boarded spaceship carries the player
+SPRITE_CACHE_SIZE = 512  # Max number of pre-rendered effect surfaces kept around
+ALPHA_BUCKET = 16  # Effect alphas are rounded to multiples of this so sprites can be shared
+PLATFORM_TEXTURE_CACHE_SIZE = 64  # Max number of distinct platform textures kept around
+PLATFORM_WIDTH_STEP = 1  # Generated platform widths are rounded to this; raise it to share more textures
+GLOW_RAMP_STEPS = 16  # Color ramp resolution of the meteorite/shooting star glow bank
+TEXT_CACHE_SIZE = 128  # Max number of rendered strings kept around
+DIRTY_RECT_RENDERING = False  # Only redraw and push the regions that changed (for GPU-less machines)
+DIRTY_RECT_LIMIT = 400  # Above this many dirty rects a full redraw is cheaper
+PARTICLE_ALPHA_STEPS = 16  # Particles fade through this many pre-rendered alpha levels
+PARTICLE_TABLE_CACHE_SIZE = 16  # Max number of palettes whose particle sprites are kept for sharing
+BROADPHASE_CELL_SIZE = 64  # Width of the x buckets used to find collision candidates
+PROJECTILE_CAPACITY = 256  # Monster shots alive at once, further shots are dropped
+BACKGROUND_STARS = 200
+BACKGROUND_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".run3_cache")
+BACKGROUND_SEED = 0  # The starfield is the same every run, separate from the level seed, so it is cached once
+BACKGROUND_CACHE_FILES = 8  # Backgrounds kept on disk, one per resolution and seed
+BACKGROUND_VERSION = 1  # Bump when the backdrop changes so stale cache files are ignored
+LEVEL_CHUNK_WIDTH = WIDTH  # World width of each pre-generated piece of level
+LEVEL_QUEUE_CHUNKS = 3  # Chunks the generator may get ahead of the camera
+LEVEL_THREAD = True  # Generate chunks on a worker thread instead of inline
+MONSTER_START_SCORE = 300  # Monsters appear in the level from where the camera is at this score
+MONSTER_CHANCE = 0.25  # Chance of a monster after each new platform
+POWERUP_CHANCE = 0.15  # Chance of a powerup on each new platform
+SPIKE_CHANCE = 0.15  # Chance of a spike on each new platform
+SPACESHIP_CHANCE = 0.3  # Chance of a spaceship once SPACESHIP_SPACING_TICKS of scrolling have passed
+SPACESHIP_SPACING_TICKS = 10 * TICK_RATE  # At least 10 seconds of scrolling between spaceships
+FX_DENSITY = 1.0  # Meteorites and shooting stars per spawn, fractions spawn one that often
+METEOR_CAPACITY = 8  # Meteorites alive at once per unit of FX_DENSITY
+SHOOTING_STAR_CAPACITY = 4  # Likewise for shooting stars
+WORLD_LAYERS = ("platforms", "spikes", "monsters", "powerups", "spaceships")  # Layers drawn relative to the camera
+# Render queue layers, flushed back to front in this order
+RENDER_LAYERS = ("particles", "shooting_stars", "meteorites", "platforms", "spikes", "monsters", "projectiles",
+                 "powerups", "player", "hud", "effects", "background_particles", "spaceships")
+# Timed parts of a frame. Each draw layer is timed from queueing its sprites to blitting them.
+PROFILE_SECTIONS = (("events", "entities", "collision", "generation", "fx", "background") + RENDER_LAYERS +
+                    ("shake", "overlay", "present"))
+PROFILE_WINDOW = 2 * FPS  # Frames the overlay's percentiles are taken over, two seconds at the render cap
+PROFILE_OVERLAY_REFRESH = 30  # Frames between overlay redraws, so it doesn't cost much itself
+
+# Input bits, as passed to Game.step and stored in replay files
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_SPACE = 4
+INPUT_LSHIFT = 8
+INPUT_P = 16
+INPUT_R = 32
+INPUT_KEYS = ((pygame.K_LEFT, INPUT_LEFT), (pygame.K_RIGHT, INPUT_RIGHT), (pygame.K_SPACE, INPUT_SPACE),
+              (pygame.K_LSHIFT, INPUT_LSHIFT), (pygame.K_p, INPUT_P), (pygame.K_r, INPUT_R))
+REPLAY_MAGIC = b"R3RP"
+REPLAY_VERSION = 4
+REPLAY_HEADER = struct.Struct("<4sBQHd")  # Magic, version, seed, tick rate, fx density (double, so it replays exactly)
+REPLAY_RECORD = struct.Struct("<IBB")  # Tick, held keys, keys pressed this tick
 
 # Colors
 WHITE = (255, 255, 255)
@@ -40,114 +105,888 @@ ORANGE = (255, 150, 50)
 CYAN = (0, 255, 255)
 MAGENTA = (255, 0, 255)
 
-# Create the game window
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Run 3")
-clock = pygame.time.Clock()
+MUSIC_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "space_synth.mp3")
+MUSIC_VOLUME = 0.5
+HUD_FONT_SIZES = (24, 36, 48, 72)  # Loaded during startup so the first frame doesn't wait on them
 
-class Projectile:
-    def __init__(self, x, y, target_x, target_y):
-        self.x = x
-        self.y = y
-        self.radius = 5
-        self.color = ORANGE
-        self.speed = 7
-        
-        # Calculate direction
-        dx = target_x - x
-        dy = target_y - y
-        distance = math.sqrt(dx * dx + dy * dy)
-        self.vx = (dx / distance) * self.speed
-        self.vy = (dy / distance) * self.speed
+class StartupReport:
+    # Wall time of each startup phase, so time to first frame can be tracked
+    def __init__(self):
+        self.phases = OrderedDict()
+        self.first_frame = None  # Seconds from the start of the import to the first frame shown
 
-    def update(self):
-        self.x += self.vx
-        self.y += self.vy
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0) + seconds
+
+    def frame_shown(self):
+        if self.first_frame is None:
+            self.first_frame = time.perf_counter() - IMPORT_STARTED
+
+    def print(self):
+        # Audio loads alongside the other phases, so it isn't part of the first frame
+        print(f"{'phase':<14}{'ms':>9}")
+        for name, seconds in self.phases.items():
+            print(f"{name:<14}{seconds * 1000:>9.1f}")
+        print(f"{'first frame':<14}{self.first_frame * 1000:>9.1f}")
+
+startup = StartupReport()
+
+class ProfileSection:
+    # Adds the time spent inside a with block to one slot of the profiler's frame times
+    __slots__ = ("times", "index", "started")
+
+    def __init__(self, times, index):
+        self.times = times
+        self.index = index
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.times[self.index] += time.perf_counter() - self.started
+
+class IdleSection:
+    # Stands in for every section while profiling is off
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+idle_section = IdleSection()
+
+class FrameProfiler:
+    # Per-frame section times plus surface allocation and blit counts. F3 shows the
+    # recent percentiles on screen and --profile-csv keeps every frame for export.
+    def __init__(self, sections=PROFILE_SECTIONS):
+        self.names = sections
+        self.columns = ("frame_ms",) + sections + ("other", "allocs", "blits")
+        self.times = [0.0] * len(sections)
+        self.sections = {name: ProfileSection(self.times, index) for index, name in enumerate(sections)}
+        self.enabled = False
+        self.overlay = False
+        self.keep_history = False
+        self.history = []  # One row per frame, only while keeping history
+        self.recent = np.zeros((PROFILE_WINDOW, len(self.columns)))
+        self.recent_count = 0  # Frames written to the recent ring so far
+        self.allocs = 0
+        self.blits = 0
+        self.frame_started = 0.0
+        self.overlay_surface = None
+
+    def section(self, name):
+        return self.sections[name] if self.enabled else idle_section
+
+    def count_alloc(self):
+        self.allocs += 1
+
+    def count_blits(self, count=1):
+        self.blits += count
+
+    def toggle_overlay(self):
+        self.overlay = not self.overlay
+        self.overlay_surface = None
+        self.enabled = self.overlay or self.keep_history
+
+    def record(self):
+        # Keep every frame from now on, for write_csv
+        self.keep_history = True
+        self.enabled = True
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        for index in range(len(self.times)):
+            self.times[index] = 0.0
+        self.allocs = 0
+        self.blits = 0
+        self.frame_started = time.perf_counter()
+
+    def end_frame(self):
+        if not self.enabled or self.frame_started == 0.0:
+            return
+        total = time.perf_counter() - self.frame_started
+        self.frame_started = 0.0
+        row = [total * 1000] + [seconds * 1000 for seconds in self.times]
+        row += [(total - sum(self.times)) * 1000, self.allocs, self.blits]
+        self.recent[self.recent_count % PROFILE_WINDOW] = row
+        self.recent_count += 1
+        if self.keep_history:
+            self.history.append(row)
+
+    def percentiles(self, rows):
+        # p50, p95 and p99 of every column
+        return np.percentile(np.asarray(rows, dtype=np.float64), (50, 95, 99), axis=0)
+
+    def write_csv(self, path):
+        # One row per frame, then the p50, p95 and p99 rows with the percentile in the frame column
+        with open(path, "w") as csv:
+            csv.write("frame," + ",".join(self.columns) + "\n")
+            for frame, row in enumerate(self.history):
+                csv.write(f"{frame}," + ",".join(f"{value:.4f}" for value in row) + "\n")
+            if self.history:
+                for label, row in zip(("p50", "p95", "p99"), self.percentiles(self.history)):
+                    csv.write(f"{label}," + ",".join(f"{value:.4f}" for value in row) + "\n")
+
+    def print_summary(self):
+        if not self.history:
+            return
+        p50, p95, p99 = self.percentiles(self.history)
+        print(f"{'section':<22}{'p50':>9}{'p95':>9}{'p99':>9}")
+        for column, values in zip(self.columns, zip(p50, p95, p99)):
+            print(f"{column:<22}" + "".join(f"{value:>9.3f}" for value in values))
 
     def draw(self, surface):
-        pygame.draw.circle(surface, self.color, (int(self.x), int(self.y)), self.radius)
+        # Recent percentiles in the top right corner, re-rendered every few frames
+        if self.overlay_surface is None or self.recent_count % PROFILE_OVERLAY_REFRESH == 0:
+            self.overlay_surface = self.render_overlay()
+        surface.blit(self.overlay_surface, (surface.get_width() - self.overlay_surface.get_width() - 10, 10))
+        self.count_blits()
+
+    def render_overlay(self):
+        font = fonts.get(18)
+        count = min(self.recent_count, PROFILE_WINDOW)
+        lines = [("", "p50", "p99")]
+        if count:
+            p50, _, p99 = self.percentiles(self.recent[:count])
+            for column, median, worst in zip(self.columns, p50, p99):
+                # Sections that took no time in the window would only be noise
+                if worst > 0.001:
+                    number = "{:.0f}" if column in ("allocs", "blits") else "{:.2f}"
+                    lines.append((column, number.format(median), number.format(worst)))
+        line_height = font.get_linesize()
+        overlay = new_surface((250, line_height * len(lines) + 10), pygame.SRCALPHA)
+        overlay.fill((0, 0, 0, 160))
+        for row, (name, median, worst) in enumerate(lines):
+            y = 5 + row * line_height
+            overlay.blit(font.render(name, True, WHITE), (8, y))
+            for text, right in ((median, 195), (worst, 242)):
+                rendered = font.render(text, True, WHITE)
+                overlay.blit(rendered, (right - rendered.get_width(), y))
+            self.allocs += 3  # The three rows of text rendered just above
+        return overlay
+
+profiler = FrameProfiler()
+
+def new_surface(size, flags=0):
+    # Every surface made while the game runs comes from here, or counts itself like font
+    # renders do, so the profiler's allocs column sees it
+    profiler.count_alloc()
+    return pygame.Surface(size, flags)
+
+def display_format(sprite):
+    # Copy of the sprite in the display's pixel format so blits stay on the fast path, or
+    # the sprite itself when there is no display. The copy is a new surface too.
+    if pygame.display.get_surface() is None:
+        return sprite
+    profiler.count_alloc()
+    return sprite.convert_alpha()
+
+def quantize_alpha(alpha):
+    # Snap an alpha value to its bucket so near-identical glows share a sprite
+    alpha = max(0, min(255, int(alpha)))
+    return min(255, round(alpha / ALPHA_BUCKET) * ALPHA_BUCKET)
+
+def surface_bytes(sprite):
+    return sprite.get_pitch() * sprite.get_height()
+
+class SpriteCache:
+    # Keyed store of pre-rendered effect surfaces with least-recently-used eviction
+    def __init__(self, max_entries=SPRITE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.sprites = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.memory = 0  # Bytes held by cached surfaces
+
+    def get(self, key, render):
+        sprite = self.sprites.get(key)
+        if sprite is not None:
+            self.sprites.move_to_end(key)
+            self.hits += 1
+            return sprite
+
+        self.misses += 1
+        sprite = display_format(render())
+        self.sprites[key] = sprite
+        self.memory += surface_bytes(sprite)
+
+        # Drop the least recently used sprites once we are over budget
+        while len(self.sprites) > self.max_entries:
+            _, old_sprite = self.sprites.popitem(last=False)
+            self.memory -= surface_bytes(old_sprite)
+            self.evictions += 1
+        return sprite
+
+    def circle(self, radius, color, alpha=255):
+        alpha = quantize_alpha(alpha)
+        key = ("circle", radius, color[:3], alpha)
+
+        def render():
+            sprite = new_surface((radius * 2, radius * 2), pygame.SRCALPHA)
+            pygame.draw.circle(sprite, (*color[:3], alpha), (radius, radius), radius)
+            return sprite
+
+        return self.get(key, render)
+
+    def rect(self, width, height, color, alpha=255, border_radius=0, padding=0):
+        # Padding leaves a transparent margin around the rect, like the glow surfaces do
+        alpha = quantize_alpha(alpha)
+        key = ("rect", (width, height), color[:3], alpha, border_radius, padding)
+
+        def render():
+            sprite = new_surface((width + padding * 2, height + padding * 2), pygame.SRCALPHA)
+            pygame.draw.rect(sprite, (*color[:3], alpha),
+                             (padding, padding, width, height), border_radius=border_radius)
+            return sprite
+
+        return self.get(key, render)
+
+    def triangle(self, width, height, color, alpha=255, padding=0):
+        alpha = quantize_alpha(alpha)
+        key = ("triangle", (width, height), color[:3], alpha, padding)
+
+        def render():
+            sprite = new_surface((width + padding * 2, height + padding * 2), pygame.SRCALPHA)
+            pygame.draw.polygon(sprite, (*color[:3], alpha), [
+                (width / 2 + padding, padding),
+                (padding, height + padding),
+                (width + padding, height + padding)
+            ])
+            return sprite
+
+        return self.get(key, render)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.sprites),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_bytes": self.memory,
+        }
+
+    def clear(self):
+        self.sprites.clear()
+        self.memory = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+# Particle kinds held by the player's engine
+DASH_PARTICLE = 0
+LANDING_PARTICLE = 1
+JUMP_PARTICLE = 2
+
+# Shared cache for every glow/effect surface drawn by the game objects
+sprite_cache = SpriteCache()
+# Gradient textures for platforms, keyed by (width, height)
+platform_textures = SpriteCache(PLATFORM_TEXTURE_CACHE_SIZE)
+
+def quantize_platform_width(width):
+    return max(PLATFORM_WIDTH_STEP, round(width / PLATFORM_WIDTH_STEP) * PLATFORM_WIDTH_STEP)
+
+class GlowBank:
+    # Radial glow sprites indexed by (radius, layer, alpha bucket, color ramp position).
+    # Layer 0 is the solid body, glow layer n is drawn at radius * (n + 1).
+    def __init__(self, ramp_steps=GLOW_RAMP_STEPS):
+        self.ramp_steps = ramp_steps
+        self.ramps = {}
+        self.sprites = {}
+        self.stamps = {}
+
+    def add_ramp(self, name, start_color, end_color):
+        last = self.ramp_steps - 1
+        self.ramps[name] = [
+            tuple(int(end_color[c] * (i / last) + start_color[c] * (1 - i / last)) for c in range(3))
+            for i in range(self.ramp_steps)
+        ]
+
+    def ramp_position(self, t):
+        return min(self.ramp_steps - 1, int(t * (self.ramp_steps - 1) + 0.5))
+
+    def sprite(self, ramp, radius, layer, alpha, position=0):
+        alpha = quantize_alpha(alpha)
+        key = (ramp, radius, layer, alpha, position)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            size = radius * (layer + 1)
+            sprite = new_surface((size * 2, size * 2), pygame.SRCALPHA)
+            pygame.draw.circle(sprite, (*self.ramps[ramp][position], alpha), (size, size), size)
+            sprite = display_format(sprite)
+            self.sprites[key] = sprite
+        return sprite
+
+    def stamp(self, key, build):
+        # A stamp is the list of (sprite, offset) blits for one trail point, built once per key
+        stamp = self.stamps.get(key)
+        if stamp is None:
+            stamp = self.stamps[key] = build()
+        return stamp
+
+glow_bank = GlowBank()
+glow_bank.add_ramp("meteor", (255, 100, 0), (255, 200, 0))  # Orange core to yellow outer glow
+glow_bank.add_ramp("star", WHITE, WHITE)
+
+class FontRegistry:
+    # One Font object per (name, size), created on first use
+    def __init__(self):
+        self.fonts = {}
+
+    def get(self, size, name=None):
+        key = (name, size)
+        font = self.fonts.get(key)
+        if font is None:
+            if not pygame.font.get_init():
+                pygame.font.init()  # Tools can draw frames without calling init()
+            font = self.fonts[key] = pygame.font.Font(name, size)
+        return font
+
+fonts = FontRegistry()
+
+class TextCache:
+    # Rendered strings that are only re-rendered when the text, style or fade changes
+    def __init__(self, max_entries=TEXT_CACHE_SIZE):
+        self.sprites = SpriteCache(max_entries)
+
+    def render(self, text, size, color, glow=0, alpha=255):
+        alpha = quantize_alpha(alpha)
+        key = (text, size, color, glow, alpha)
+        return self.sprites.get(key, lambda: self.render_text(text, size, color, glow, alpha))
+
+    def render_text(self, text, size, color, glow, alpha):
+        profiler.count_alloc()
+        text_surface = fonts.get(size).render(text, True, color)
+        if glow == 0 and alpha == 255:
+            return text_surface
+        # Layering the text on itself brightens its anti-aliased edges into a glow
+        sprite = new_surface(text_surface.get_size(), pygame.SRCALPHA)
+        for _ in range(glow + 1):
+            sprite.blit(text_surface, (0, 0))
+        if alpha < 255:
+            sprite.fill((255, 255, 255, alpha), special_flags=pygame.BLEND_RGBA_MULT)
+        return sprite
+
+text_cache = TextCache()
+
+class DigitAtlas:
+    # Cached digit glyphs so numbers that change every frame are composed, not rendered
+    def __init__(self, size, color, glow=0):
+        self.size = size
+        self.color = color
+        self.glow = glow
+        self.glyphs = None
+
+    def build(self):
+        font = fonts.get(self.size)
+        self.glyphs = {}
+        for digit, metrics in zip("0123456789", font.metrics("0123456789")):
+            advance = metrics[4]
+            self.glyphs[digit] = (text_cache.render(digit, self.size, self.color, self.glow), advance)
+
+    def draw(self, surface, prefix, number, pos):
+        if self.glyphs is None:
+            self.build()
+        x, y = pos
+        prefix_surface = text_cache.render(prefix, self.size, self.color, self.glow)
+        surface.blit(prefix_surface, (x, y))
+        x += fonts.get(self.size).size(prefix)[0]
+        for digit in str(number):
+            glyph, advance = self.glyphs[digit]
+            surface.blit(glyph, (x, y))
+            x += advance
+
+    def measure(self, prefix, number, pos):
+        if self.glyphs is None:
+            self.build()
+        width = fonts.get(self.size).size(prefix)[0]
+        width += sum(self.glyphs[digit][1] for digit in str(number))
+        height = text_cache.render(prefix, self.size, self.color, self.glow).get_height()
+        return pygame.Rect(pos[0], pos[1], width, height)
+
+score_digits = DigitAtlas(36, WHITE, glow=3)
+
+class Soundtrack:
+    # Background music. The mixer is opened and the file loaded on a worker thread so the
+    # first frame doesn't wait on the audio device or the mp3. Playback asked for before
+    # then starts as soon as it's ready, and a missing file or audio device means silence.
+    def __init__(self, path=MUSIC_FILE):
+        self.path = path
+        self.ready = threading.Event()
+        self.loaded = False
+        self.error = None
+        self.wanted = False
+        self.paused = False
+        self.playing = False
+
+    def load_async(self):
+        threading.Thread(target=self.load, daemon=True).start()
+
+    def load(self):
+        try:
+            with startup.phase("audio"):
+                if not pygame.mixer.get_init():
+                    pygame.mixer.init()
+                pygame.mixer.music.load(self.path)
+                pygame.mixer.music.set_volume(MUSIC_VOLUME)
+            self.loaded = True
+        except (pygame.error, OSError) as error:
+            self.error = error
+            print(f"Music disabled: {error}")
+        self.ready.set()
+
+    def update(self):
+        # Called every tick from the main thread, starts playback once loading is done
+        if self.wanted and self.loaded and not self.playing:
+            pygame.mixer.music.play(-1)  # -1 means loop indefinitely
+            self.playing = True
+            if self.paused:
+                pygame.mixer.music.pause()
+
+    def play(self):
+        self.wanted = True
+        self.update()
+
+    def stop(self):
+        self.wanted = False
+        if self.playing:
+            pygame.mixer.music.stop()
+            self.playing = False
+
+    def pause(self):
+        self.paused = True
+        if self.playing:
+            pygame.mixer.music.pause()
+
+    def unpause(self):
+        self.paused = False
+        if self.playing:
+            pygame.mixer.music.unpause()
+
+soundtrack = Soundtrack()
+
+def init(headless=False):
+    # Brings up only the pygame subsystems a run needs and returns the window, or None
+    # when headless. Importing the module touches none of them.
+    screen = None
+    if not headless:
+        with startup.phase("display"):
+            pygame.display.init()
+            screen = pygame.display.set_mode((WIDTH, HEIGHT))
+            pygame.display.set_caption("Run 3")
+    with startup.phase("fonts"):
+        pygame.font.init()
+        for size in HUD_FONT_SIZES:
+            fonts.get(size)
+    if not headless:
+        soundtrack.load_async()
+    return screen
+
+def points_rect(points, pad):
+    # Bounding rect of a list of (x, y) points, grown by pad on every side
+    xs = [int(p[0]) for p in points]
+    ys = [int(p[1]) for p in points]
+    left, top = min(xs) - pad, min(ys) - pad
+    return pygame.Rect(left, top, max(xs) + pad - left + 1, max(ys) + pad - top + 1)
+
+class SpatialGrid:
+    # Uniform grid of x buckets. The level only scrolls sideways, so bucketing on x alone
+    # is enough to skip everything that isn't near the player.
+    def __init__(self, cell_size=None):
+        self.cell_size = cell_size if cell_size is not None else BROADPHASE_CELL_SIZE
+        self.cells = {}
+        self.count = 0
+
+    def clear(self):
+        self.cells.clear()
+        self.count = 0
+
+    def insert(self, item, left, right):
+        # Items spanning several cells go in each of them, tagged with their insertion index
+        entry = (self.count, item)
+        self.count += 1
+        for cell in range(int(left) // self.cell_size, int(right) // self.cell_size + 1):
+            bucket = self.cells.get(cell)
+            if bucket is None:
+                self.cells[cell] = [entry]
+            else:
+                bucket.append(entry)
+
+    def remove(self, item, left, right):
+        for cell in range(int(left) // self.cell_size, int(right) // self.cell_size + 1):
+            bucket = self.cells.get(cell)
+            if bucket is not None:
+                bucket[:] = [entry for entry in bucket if entry[1] is not item]
+                if not bucket:
+                    del self.cells[cell]
+
+    def query(self, left, right):
+        # Items overlapping [left, right] in insertion order, each listed once
+        found = {}
+        for cell in range(int(left) // self.cell_size, int(right) // self.cell_size + 1):
+            bucket = self.cells.get(cell)
+            if bucket is not None:
+                for index, item in bucket:
+                    found[index] = item
+        return [found[index] for index in sorted(found)]
+
+class RenderLayer:
+    # Collects the blits for one layer. It has the same blit/blits API as a Surface,
+    # so draw methods can be handed a layer instead of the screen.
+    def __init__(self):
+        self.items = []
+        self.offset = (0, 0)  # Subtracted from every destination, e.g. the camera position
+
+    def blit(self, source, dest, area=None, special_flags=0):
+        if self.offset != (0, 0):
+            dest = (dest[0] - self.offset[0], dest[1] - self.offset[1])
+        if area is None and special_flags == 0:
+            self.items.append((source, dest))
+        else:
+            self.items.append((source, dest, area, special_flags))
+
+    def blits(self, blit_sequence, doreturn=True):
+        if self.offset != (0, 0):
+            for item in blit_sequence:
+                self.blit(*item)
+        else:
+            self.items.extend(blit_sequence)
+
+class RenderQueue:
+    # Draw order is kept by flushing the layers in order, one Surface.blits call each
+    def __init__(self, layer_names=RENDER_LAYERS):
+        self.layers = {name: RenderLayer() for name in layer_names}
+
+    def layer(self, name):
+        return self.layers[name]
+
+    def flush(self, surface):
+        for name, layer in self.layers.items():
+            if layer.items:
+                with profiler.section(name):
+                    surface.blits(layer.items, doreturn=False)
+                profiler.count_blits(len(layer.items))
+                layer.items.clear()
+
+class ParticleEngine:
+    # Struct-of-arrays particle storage with a fixed capacity. Emission, ageing and culling
+    # are vectorized and drawing is one Surface.blits call over pre-rendered sprites.
+    max_size = 4  # Largest particle radius
+    sprite_tables = OrderedDict()  # Engines with the same palette share their sprites, least recently used go first
+
+    def __init__(self, capacity, palette, rng=None):
+        self.capacity = capacity
+        self.palette = list(palette)
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.count = 0
+        self.x = np.zeros(capacity, np.float32)
+        self.y = np.zeros(capacity, np.float32)
+        self.vx = np.zeros(capacity, np.float32)
+        self.vy = np.zeros(capacity, np.float32)
+        self.life = np.zeros(capacity, np.int32)
+        self.fade = np.ones(capacity, np.int32)  # Alpha is life / fade
+        self.size = np.zeros(capacity, np.int32)  # Radius
+        self.color = np.zeros(capacity, np.int32)  # Index into the palette
+        self.kind = np.zeros(capacity, np.int8)  # Lets one engine hold several effects
+        self.previous_x = np.zeros(capacity, np.float32)  # Positions at the previous tick, for render interpolation
+        self.previous_y = np.zeros(capacity, np.float32)
+        self.arrays = (self.x, self.y, self.vx, self.vy, self.life, self.fade, self.size, self.color, self.kind,
+                       self.previous_x, self.previous_y)
+        # Sprite per (color, size, alpha step), filled in on first use
+        # Every game rolls its own background palette, so the shared tables are capped. An
+        # engine keeps its own table, and eviction only stops new engines from sharing it.
+        palette_key = tuple(self.palette)
+        tables = self.sprite_tables
+        if palette_key in tables:
+            tables.move_to_end(palette_key)
+        else:
+            tables[palette_key] = [None] * (len(self.palette) * (self.max_size + 1) * (PARTICLE_ALPHA_STEPS + 1))
+            while len(tables) > PARTICLE_TABLE_CACHE_SIZE:
+                tables.popitem(last=False)
+        self.sprites = tables[palette_key]
+
+    def __len__(self):
+        return self.count
+
+    def emit(self, count, x, y, life, vx=0, vy=0, size=1, color=0, fade=20, kind=0):
+        # Every attribute can be a scalar or an array with one value per particle
+        count = min(count, self.capacity - self.count)
+        if count <= 0:
+            return 0
+        start, end = self.count, self.count + count
+        for array, value in ((self.x, x), (self.y, y), (self.vx, vx), (self.vy, vy), (self.life, life),
+                             (self.fade, fade), (self.size, size), (self.color, color), (self.kind, kind)):
+            array[start:end] = value[:count] if np.ndim(value) else value
+        self.previous_x[start:end] = self.x[start:end]
+        self.previous_y[start:end] = self.y[start:end]
+        self.count = end
+        return count
+
+    def update(self):
+        count = self.count
+        if not count:
+            return
+        self.previous_x[:count] = self.x[:count]
+        self.previous_y[:count] = self.y[:count]
+        self.x[:count] += self.vx[:count]
+        self.y[:count] += self.vy[:count]
+        self.life[:count] -= 1
+        self.cull()
+
+    def cull(self):
+        # Swap-remove: dead slots below the new count are refilled from live particles above it
+        count = self.count
+        dead = np.flatnonzero(self.life[:count] <= 0)
+        if len(dead) == 0:
+            return
+        alive_count = count - len(dead)
+        holes = dead[dead < alive_count]
+        movers = np.flatnonzero(self.life[alive_count:count] > 0) + alive_count
+        for array in self.arrays:
+            array[holes] = array[movers]
+        self.count = alive_count
+
+    def clear(self):
+        self.count = 0
+
+    def selection(self, kind=None):
+        if kind is None:
+            return slice(0, self.count)
+        return np.flatnonzero(self.kind[:self.count] == kind)
+
+    def positions(self, selection, alpha=1.0):
+        # Positions alpha of the way from the previous tick to this one
+        previous_x = self.previous_x[selection]
+        previous_y = self.previous_y[selection]
+        return (previous_x + (self.x[selection] - previous_x) * alpha,
+                previous_y + (self.y[selection] - previous_y) * alpha)
+
+    def draw(self, surface, kind=None, offset=(0, 0), alpha=1.0):
+        selection = self.selection(kind)
+        life = self.life[selection]
+        if len(life) == 0:
+            return
+        steps = np.clip(life * PARTICLE_ALPHA_STEPS // self.fade[selection], 0, PARTICLE_ALPHA_STEPS)
+        keys = ((self.color[selection] * (self.max_size + 1) + self.size[selection])
+                * (PARTICLE_ALPHA_STEPS + 1) + steps)
+
+        sprites = self.sprites
+        for key in np.unique(keys).tolist():
+            if sprites[key] is None:
+                sprites[key] = self.render_sprite(key)
+
+        xs, ys = self.positions(selection, alpha)
+        xs = (xs + offset[0]).astype(np.int32).tolist()
+        ys = (ys + offset[1]).astype(np.int32).tolist()
+        surface.blits(zip(map(sprites.__getitem__, keys.tolist()), zip(xs, ys)), doreturn=False)
+
+    def render_sprite(self, key):
+        key, step = divmod(key, PARTICLE_ALPHA_STEPS + 1)
+        color, size = divmod(key, self.max_size + 1)
+        sprite = new_surface((size * 2, size * 2), pygame.SRCALPHA)
+        pygame.draw.circle(sprite, (*self.palette[color], 255 * step // PARTICLE_ALPHA_STEPS), (size, size), size)
+        return display_format(sprite)
+
+    def rects(self, alpha=1.0):
+        count = self.count
+        xs, ys = self.positions(slice(0, count), alpha)
+        return [pygame.Rect(x, y, size * 2, size * 2) for x, y, size in
+                zip(xs.astype(np.int32).tolist(), ys.astype(np.int32).tolist(), self.size[:count].tolist())]
+
+    def bounds(self, alpha=1.0):
+        count = self.count
+        if count == 0:
+            return None
+        xs, ys = self.positions(slice(0, count), alpha)
+        left, top = int(xs.min()), int(ys.min())
+        right = int(xs.max()) + self.max_size * 2 + 1
+        bottom = int(ys.max()) + self.max_size * 2 + 1
+        return pygame.Rect(left, top, right - left, bottom - top)
+
+class ProjectilePool:
+    # Every monster shot lives in one fixed-capacity pool, in world coordinates. Moving,
+    # culling and the player hit test each run over the whole pool at once, and shots
+    # outlive the monster that fired them.
+    radius = 5
+    color = ORANGE
+    speed = 7
+
+    def __init__(self, capacity=None):
+        self.capacity = capacity if capacity is not None else PROJECTILE_CAPACITY
+        self.count = 0
+        self.x = np.zeros(self.capacity)
+        self.y = np.zeros(self.capacity)
+        self.vx = np.zeros(self.capacity)
+        self.vy = np.zeros(self.capacity)
+        self.previous_x = np.zeros(self.capacity)  # Positions at the previous tick, for render interpolation
+        self.previous_y = np.zeros(self.capacity)
+        self.arrays = (self.x, self.y, self.vx, self.vy, self.previous_x, self.previous_y)
+
+    def __len__(self):
+        return self.count
+
+    def spawn(self, x, y, target_x, target_y):
+        # Aim at the target. Returns False if the pool is full.
+        if self.count == self.capacity:
+            return False
+        dx = target_x - x
+        dy = target_y - y
+        distance = math.sqrt(dx * dx + dy * dy)
+        if distance == 0:
+            # Fired from the target itself: head left, back along the level
+            vx, vy = -self.speed, 0.0
+        else:
+            vx = (dx / distance) * self.speed
+            vy = (dy / distance) * self.speed
+        # Spawning happens after this frame's update, so the shot takes its first step now
+        index = self.count
+        self.previous_x[index] = x
+        self.previous_y[index] = y
+        self.x[index] = x + vx
+        self.y[index] = y + vy
+        self.vx[index] = vx
+        self.vy[index] = vy
+        self.count += 1
+        return True
+
+    def update(self, scroll_speed):
+        # Shots keep their heading on screen, so they travel along with the camera
+        count = self.count
+        self.previous_x[:count] = self.x[:count]
+        self.previous_y[:count] = self.y[:count]
+        self.x[:count] += self.vx[:count] + scroll_speed
+        self.y[:count] += self.vy[:count]
+
+    def cull(self, camera_x):
+        # Swap-remove everything that left the screen
+        count = self.count
+        x = self.x[:count] - camera_x
+        y = self.y[:count]
+        alive = (x >= 0) & (x <= WIDTH) & (y >= 0) & (y <= HEIGHT)
+        alive_count = int(np.count_nonzero(alive))
+        if alive_count == count:
+            return
+        holes = np.flatnonzero(~alive[:alive_count])
+        movers = np.flatnonzero(alive[alive_count:]) + alive_count
+        for array in self.arrays:
+            array[holes] = array[movers]
+        self.count = alive_count
+
+    def clear(self):
+        self.count = 0
+
+    def hits(self, x, y, width, height):
+        # True if any shot overlaps the box, tested against each shot's bounding square
+        count = self.count
+        if count == 0:
+            return False
+        px = self.x[:count]
+        py = self.y[:count]
+        r = self.radius
+        return bool(np.any((x < px + r) & (x + width > px - r) & (y < py + r) & (y + height > py - r)))
+
+    def positions(self, camera_x, alpha=1.0):
+        # Screen positions, alpha of the way from the previous tick to this one
+        count = self.count
+        previous_x = self.previous_x[:count]
+        previous_y = self.previous_y[:count]
+        xs = previous_x + (self.x[:count] - previous_x) * alpha - camera_x
+        ys = previous_y + (self.y[:count] - previous_y) * alpha
+        return xs.astype(np.int32).tolist(), ys.astype(np.int32).tolist()
+
+    def draw(self, surface, camera_x, alpha=1.0):
+        count = self.count
+        if count == 0:
+            return
+        r = self.radius
+        core_surface = sprite_cache.circle(r, self.color)
         # Add glow effect
-        glow_surface = pygame.Surface((self.radius * 4, self.radius * 4), pygame.SRCALPHA)
-        pygame.draw.circle(glow_surface, (*self.color[:3], 100), (self.radius * 2, self.radius * 2), self.radius * 2)
-        surface.blit(glow_surface, (int(self.x) - self.radius * 2, int(self.y) - self.radius * 2))
+        glow_surface = sprite_cache.circle(r * 2, self.color, 100)
+        xs, ys = self.positions(camera_x, alpha)
+        blits = []
+        for x, y in zip(xs, ys):
+            blits.append((core_surface, (x - r, y - r)))
+            blits.append((glow_surface, (x - r * 2, y - r * 2)))
+        surface.blits(blits, doreturn=False)
+
+    def rects(self, camera_x, alpha=1.0):
+        r = self.radius
+        return [pygame.Rect(x - r * 2, y - r * 2, r * 4, r * 4) for x, y in zip(*self.positions(camera_x, alpha))]
 
 class Monster:
+    __slots__ = ("x", "y", "shoot_cooldown")
+    width = 30
+    height = 30
+    color = PURPLE
+    shoot_delay = 120  # Increased from 60 to 120 frames between shots
+
     def __init__(self, x, y):
         self.x = x
         self.y = y
-        self.width = 30
-        self.height = 30
-        self.color = PURPLE
         self.shoot_cooldown = 0
-        self.shoot_delay = 120  # Increased from 60 to 120 frames between shots
-        self.projectiles = []
 
-    def update(self, player_x, player_y):
-        self.x -= SCROLL_SPEED
+    def update(self, player_x, player_y, projectiles):
+        # The player position is in world coordinates, shots go into the shared pool
         self.shoot_cooldown = max(0, self.shoot_cooldown - 1)
-        
+
         # Shoot at player
         if self.shoot_cooldown == 0:
-            self.shoot(player_x, player_y)
+            self.shoot(player_x, player_y, projectiles)
             self.shoot_cooldown = self.shoot_delay
 
-        # Update projectiles
-        for projectile in self.projectiles:
-            projectile.update()
-
-        # Remove projectiles that are off screen
-        self.projectiles = [p for p in self.projectiles if 0 <= p.x <= WIDTH and 0 <= p.y <= HEIGHT]
-
-    def shoot(self, target_x, target_y):
-        self.projectiles.append(Projectile(self.x + self.width/2, self.y + self.height/2, target_x, target_y))
+    def shoot(self, target_x, target_y, projectiles):
+        projectiles.spawn(self.x + self.width/2, self.y + self.height/2, target_x, target_y)
 
-    def draw(self, surface):
-        # Draw monster
-        monster_surface = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
+    def render_body(self):
+        monster_surface = new_surface((self.width, self.height), pygame.SRCALPHA)
         pygame.draw.rect(monster_surface, self.color, (0, 0, self.width, self.height))
         
         # Add eyes
         pygame.draw.circle(monster_surface, RED, (self.width//3, self.height//3), 4)
         pygame.draw.circle(monster_surface, RED, (2*self.width//3, self.height//3), 4)
-        
+        return monster_surface
+
+    def draw(self, surface):
+        # Draw monster
+        monster_surface = sprite_cache.get(("monster", self.width, self.height, self.color), self.render_body)
         surface.blit(monster_surface, (self.x, self.y))
 
-        # Draw projectiles
-        for projectile in self.projectiles:
-            projectile.draw(surface)
+    def dirty_rects(self):
+        return [pygame.Rect(int(self.x), int(self.y), self.width, self.height)]
 
 class Powerup:
+    __slots__ = ("x", "y", "collected", "float_offset")
+    width = 20
+    height = 20
+    color = CYAN
+    float_speed = 0.1
+
     def __init__(self, x, y):
         self.x = x
         self.y = y
-        self.width = 20
-        self.height = 20
-        self.color = CYAN
         self.collected = False
         self.float_offset = 0
-        self.float_speed = 0.1
-        self.glow_radius = 0
-        self.glow_direction = 1
 
-    def update(self):
-        self.x -= SCROLL_SPEED
+    def update(self, ticks):
         # Floating animation
-        self.float_offset = math.sin(pygame.time.get_ticks() * self.float_speed) * 5
-        # Glow effect
-        self.glow_radius += 0.2 * self.glow_direction
-        if self.glow_radius > 5 or self.glow_radius < 0:
-            self.glow_direction *= -1
+        self.float_offset = math.sin(ticks * self.float_speed) * 5
 
-    def draw(self, surface):
-        # Draw glow effect
-        glow_surface = pygame.Surface((self.width + 20, self.height + 20), pygame.SRCALPHA)
-        glow_color = (*self.color[:3], 100)
-        pygame.draw.rect(glow_surface, glow_color, 
-                        (10, 10, self.width, self.height), border_radius=5)
-        surface.blit(glow_surface, (self.x - 10, self.y - 10 + self.float_offset))
-
-        # Draw powerup
-        powerup_surface = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
+    def render_body(self):
+        powerup_surface = new_surface((self.width, self.height), pygame.SRCALPHA)
         pygame.draw.rect(powerup_surface, self.color, 
                         (0, 0, self.width, self.height), border_radius=5)
         
@@ -156,15 +995,130 @@ class Powerup:
                         (0, 0), (self.width, 0), 2)
         pygame.draw.line(powerup_surface, (255, 255, 255, 150), 
                         (0, 0), (0, self.height), 2)
-        
+        return powerup_surface
+
+    def draw(self, surface):
+        # Draw glow effect
+        glow_surface = sprite_cache.rect(self.width, self.height, self.color, 100, border_radius=5, padding=10)
+        surface.blit(glow_surface, (self.x - 10, self.y - 10 + self.float_offset))
+
+        # Draw powerup
+        powerup_surface = sprite_cache.get(("powerup", self.width, self.height, self.color), self.render_body)
         surface.blit(powerup_surface, (self.x, self.y + self.float_offset))
 
+    def dirty_rects(self):
+        return [pygame.Rect(int(self.x) - 10, int(self.y + self.float_offset) - 10, self.width + 21, self.height + 21)]
+
+class PlayerSpriteBank:
+    # Every surface Player.draw needs, rendered once per visual state and then only blitted
+    rotations = (0, 90, -90)
+    dash_trail_steps = 5
+    max_pulse = 5
+
+    def __init__(self, width, height, color, max_trail):
+        self.width = width
+        self.height = height
+        self.color = color
+        self.max_trail = max_trail
+        self.built = False
+
+    def rounded_rect(self, color, alpha, padding=0):
+        sprite = new_surface((self.width + padding * 2, self.height + padding * 2), pygame.SRCALPHA)
+        pygame.draw.rect(sprite, (*color[:3], alpha),
+                         (padding, padding, self.width, self.height), border_radius=5)
+        return display_format(sprite)
+
+    def render_body(self, color):
+        player_surface = new_surface((self.width, self.height), pygame.SRCALPHA)
+
+        # Draw main cube with gradient
+        for i in range(self.height):
+            alpha = int(255 * (1 - i / self.height))
+            pygame.draw.line(player_surface, (*color[:3], alpha), (0, i), (self.width, i))
+
+        # Add highlight
+        highlight = new_surface((self.width//2, self.height//2), pygame.SRCALPHA)
+        highlight.fill((255, 255, 255, 100))
+        player_surface.blit(highlight, (self.width//4, self.height//4))
+
+        # Add corner highlights
+        corner_size = 5
+        highlight_color = (255, 255, 255, 150)
+        pygame.draw.rect(player_surface, highlight_color, 
+                        (0, 0, corner_size, corner_size))
+        pygame.draw.rect(player_surface, highlight_color, 
+                        (self.width - corner_size, 0, corner_size, corner_size))
+        pygame.draw.rect(player_surface, highlight_color, 
+                        (0, self.height - corner_size, corner_size, corner_size))
+        pygame.draw.rect(player_surface, highlight_color, 
+                        (self.width - corner_size, self.height - corner_size, corner_size, corner_size))
+        return player_surface
+
+    def build(self):
+        # Body and outer glow for the normal and powered-up looks, in every rotation
+        self.bodies = {}
+        self.glows = {}
+        for powered in (False, True):
+            color = CYAN if powered else self.color
+            body = self.render_body(color)
+            for rotation in self.rotations:
+                profiler.count_alloc()
+                self.bodies[(powered, rotation)] = display_format(pygame.transform.rotate(body, rotation))
+            glow_alpha = 150 if powered else 100
+            glow_size = 15 if powered else 10
+            self.glows[powered] = (self.rounded_rect(color, glow_alpha, glow_size//2), glow_size//2)
+
+        # Motion trail cube and glow, one per alpha step
+        self.trail = []
+        self.trail_glows = []
+        for step in range(self.max_trail + 1):
+            alpha = int(255 * (step / self.max_trail))
+            self.trail.append(self.rounded_rect(self.color, alpha))
+            self.trail_glows.append(self.rounded_rect(self.color, alpha//2, 5))
+
+        # Dash afterimages
+        self.dash_trail = [self.rounded_rect(self.color, int(255 * (1 - i/self.dash_trail_steps)))
+                           for i in range(self.dash_trail_steps)]
+
+        # Powerup pulse for every pulse size the sine wave can produce
+        self.pulses = {}
+        for pulse_size in range(-self.max_pulse, self.max_pulse + 1):
+            pulse_surface = new_surface((self.width + pulse_size*2, self.height + pulse_size*2), pygame.SRCALPHA)
+            pygame.draw.rect(pulse_surface, (*CYAN[:3], 50), 
+                           (pulse_size, pulse_size, self.width, self.height), border_radius=5)
+            self.pulses[pulse_size] = display_format(pulse_surface)
+
+        sparkle_surface = new_surface((4, 4), pygame.SRCALPHA)
+        pygame.draw.circle(sparkle_surface, (255, 255, 255, 200), (2, 2), 2)
+        self.sparkle = display_format(sparkle_surface)
+        self.built = True
+
+    def ensure_built(self):
+        if not self.built:
+            self.build()
+        return self
+
+    def trail_step(self, index, trail_length):
+        # Map a trail index onto the nearest pre-rendered alpha step
+        return index * self.max_trail // trail_length
+
+player_sprite_banks = {}
+
+def get_player_sprites(width, height, color, max_trail):
+    key = (width, height, color, max_trail)
+    if key not in player_sprite_banks:
+        player_sprite_banks[key] = PlayerSpriteBank(width, height, color, max_trail)
+    return player_sprite_banks[key]
+
 class Player:
-    def __init__(self):
+    def __init__(self, rng=None, effects=True):
         self.width = 30
         self.height = 30
         self.x = WIDTH // 4
         self.y = HEIGHT // 2
+        self.camera_x = 0  # World x of the screen's left edge as of the last update
+        self.previous_x = self.x  # Position at the previous tick, for render interpolation
+        self.previous_y = self.y
         self.vel_y = 0
         self.rotation = 0
         self.is_jumping = False
@@ -173,9 +1127,11 @@ class Player:
         self.wall_run_direction = 0
         self.color = BLUE
         self.is_alive = True
+        self.death_cause = None  # "spike", "projectile", "fall" or "ceiling" once dead
+        self.invulnerable = False  # Benchmarks and stress runs keep the player going with this
+        self.effects = effects  # Dash, landing and jump particles, which never affect the run
         self.trail = []
         self.max_trail = 15
-        self.jump_particles = []
         self.max_jump_particles = 30
         self.glow_radius = 0
         self.glow_direction = 1
@@ -186,19 +1142,26 @@ class Player:
         self.dash_direction = 0
         self.combo = 0
         self.combo_timer = 0
-        self.landing_particles = []
         self.score_multiplier = 1
         self.is_dashing = False
         self.dash_trail = []
         self.dash_speed = 15
         self.dash_duration = 10
         self.dash_timer = 0
-        self.dash_particles = []
         self.max_dash_particles = 20
-
-    def update(self, platforms, spikes, monsters, powerups):
+        self.max_landing_particles = 50
+        # Dash, landing and jump particles share one engine
+        self.particles = ParticleEngine(self.max_jump_particles + self.max_dash_particles + self.max_landing_particles,
+                                        [self.color], rng)
+        self.sprites = get_player_sprites(self.width, self.height, self.color, self.max_trail)
+
+    def update(self, platforms, spikes, projectiles, powerups, camera_x=0):
+        # Each list only needs the objects near the player, see Game.update, and
+        # projectiles is the shared ProjectilePool. The player lives in screen space
+        # and is compared against the world at camera_x.
         if not self.is_alive:
             return
+        self.camera_x = camera_x
 
         # Update combo timer
         if self.combo_timer > 0:
@@ -217,8 +1180,14 @@ class Player:
             if len(self.dash_trail) > 10:
                 self.dash_trail.pop(0)
 
-        # Update landing particles
-        self.landing_particles = [(x, y, life - 1) for x, y, life in self.landing_particles if life > 0]
+        # Update dash, landing and jump particles
+        if self.effects:
+            self.particles.update()
+
+        # Update glow effect
+        self.glow_radius += 0.2 * self.glow_direction
+        if self.glow_radius > 5 or self.glow_radius < 0:
+            self.glow_direction *= -1
 
         # Update powerup timer
         if self.powerup_timer > 0:
@@ -238,9 +1207,6 @@ class Player:
         if len(self.trail) > self.max_trail:
             self.trail.pop(0)
 
-        # Update jump particles
-        self.jump_particles = [(x, y, life - 1) for x, y, life in self.jump_particles if life > 0]
-
         # Update dash state
         if self.is_dashing:
             self.dash_timer -= 1
@@ -249,15 +1215,8 @@ class Player:
             else:
                 self.x += self.dash_speed * self.dash_direction
                 # Create more dash particles
-                if random.random() < 0.3:
-                    self.dash_particles.append((
-                        self.x + random.randint(-5, 5),
-                        self.y + random.randint(-5, 5),
-                        random.randint(10, 20)
-                    ))
-
-        # Update dash particles
-        self.dash_particles = [(x, y, life - 1) for x, y, life in self.dash_particles if life > 0]
+                if self.effects and self.particles.rng.random() < 0.3:
+                    self.emit_particles(DASH_PARTICLE, 1, 5, 5)
 
         # Apply gravity
         if not self.is_wall_running:
@@ -282,12 +1241,7 @@ class Player:
                     self.rotation = 0
                     self.can_double_jump = True
                     # Create landing particles
-                    for _ in range(10):
-                        self.landing_particles.append((
-                            self.x + random.randint(-10, 10),
-                            self.y + self.height,
-                            random.randint(10, 20)
-                        ))
+                    self.emit_particles(LANDING_PARTICLE, 10, 10, 0, self.height)
                 elif self.vel_y < 0:  # Jumping
                     self.y = platform.y + platform.height
                     self.vel_y = 0
@@ -297,27 +1251,33 @@ class Player:
             if self.check_wall_collision(platform):
                 if not self.is_wall_running and self.vel_y > 0:
                     self.is_wall_running = True
-                    self.wall_run_direction = 1 if self.x < platform.x else -1
+                    self.wall_run_direction = 1 if self.x + self.camera_x < platform.x else -1
                     self.vel_y = 0
                     self.can_double_jump = True
 
         # Check for spike collisions
         for spike in spikes:
-            if self.check_spike_collision(spike):
+            if self.check_spike_collision(spike) and not self.invulnerable:
                 self.is_alive = False
+                self.death_cause = "spike"
                 return
 
         # Check for projectile collisions
-        for monster in monsters:
-            for projectile in monster.projectiles:
-                if self.check_projectile_collision(projectile):
-                    self.is_alive = False
-                    return
+        if projectiles.hits(self.x + self.camera_x, self.y, self.width, self.height) and not self.invulnerable:
+            self.is_alive = False
+            self.death_cause = "projectile"
+            return
 
         # Check if player is off screen
         if self.y > HEIGHT or self.y < -self.height:
-            self.is_alive = False
-            return
+            if self.invulnerable:
+                # Drop back in from the top instead
+                self.y = 0
+                self.vel_y = 0
+            else:
+                self.is_alive = False
+                self.death_cause = "fall" if self.y > HEIGHT else "ceiling"
+                return
 
         # Keep player in horizontal bounds
         if self.x < 0:
@@ -326,32 +1286,30 @@ class Player:
             self.x = WIDTH - self.width
 
     def check_collision(self, platform):
-        return (self.x < platform.x + platform.width and
-                self.x + self.width > platform.x and
+        x = self.x + self.camera_x
+        return (x < platform.x + platform.width and
+                x + self.width > platform.x and
                 self.y + self.height > platform.y and
                 self.y < platform.y + platform.height)
 
     def check_wall_collision(self, platform):
+        x = self.x + self.camera_x
         return (self.y < platform.y + platform.height and
                 self.y + self.height > platform.y and
-                (self.x + self.width > platform.x and self.x < platform.x or
-                 self.x < platform.x + platform.width and self.x + self.width > platform.x + platform.width))
+                (x + self.width > platform.x and x < platform.x or
+                 x < platform.x + platform.width and x + self.width > platform.x + platform.width))
 
     def check_spike_collision(self, spike):
-        return (self.x < spike.x + spike.width and
-                self.x + self.width > spike.x and
+        x = self.x + self.camera_x
+        return (x < spike.x + spike.width and
+                x + self.width > spike.x and
                 self.y + self.height > spike.y and
                 self.y < spike.y + spike.height)
 
-    def check_projectile_collision(self, projectile):
-        return (self.x < projectile.x + projectile.radius and
-                self.x + self.width > projectile.x - projectile.radius and
-                self.y < projectile.y + projectile.radius and
-                self.y + self.height > projectile.y - projectile.radius)
-
     def check_powerup_collision(self, powerup):
-        return (self.x < powerup.x + powerup.width and
-                self.x + self.width > powerup.x and
+        x = self.x + self.camera_x
+        return (x < powerup.x + powerup.width and
+                x + self.width > powerup.x and
                 self.y + self.height > powerup.y and
                 self.y < powerup.y + powerup.height)
 
@@ -367,12 +1325,7 @@ class Player:
             
             # Create jump particles
             particle_count = 10 if self.has_jump_powerup else 5
-            for _ in range(particle_count):
-                self.jump_particles.append((
-                    self.x + random.randint(-5, 5),
-                    self.y + self.height,
-                    random.randint(10, 20)
-                ))
+            self.emit_particles(JUMP_PARTICLE, particle_count, 5, 0, self.height)
 
     def dash(self):
         if self.dash_cooldown == 0 and self.is_alive:
@@ -383,12 +1336,19 @@ class Player:
             self.vel_y = 0
             
             # Create dash particles
-            for _ in range(10):
-                self.dash_particles.append((
-                    self.x + random.randint(-5, 5),
-                    self.y + random.randint(-5, 5),
-                    random.randint(10, 20)
-                ))
+            self.emit_particles(DASH_PARTICLE, 10, 5, 5)
+
+    def emit_particles(self, kind, count, spread_x, spread_y, offset_y=0):
+        # Particles scatter around the player's corner and live 10-20 frames
+        if not self.effects:
+            return
+        rng = self.particles.rng
+        size = 4 if kind == DASH_PARTICLE else 3
+        self.particles.emit(count,
+                            self.x + rng.integers(-spread_x, spread_x + 1, count),
+                            self.y + offset_y + rng.integers(-spread_y, spread_y + 1, count),
+                            rng.integers(10, 21, count),
+                            size=size, kind=kind)
 
     def move_left(self):
         self.x -= MOVE_SPEED
@@ -399,348 +1359,460 @@ class Player:
     def stop_moving(self):
         pass
 
-    def draw(self, surface):
+    def position(self, alpha=1.0):
+        # Where to draw the player, alpha of the way from the previous tick to this one
+        return (self.previous_x + (self.x - self.previous_x) * alpha,
+                self.previous_y + (self.y - self.previous_y) * alpha)
+
+    def draw(self, surface, fx_rng, ticks, alpha=1.0):
+        # The powerup sparkle comes from the game's draw-time stream and the pulse follows
+        # game time in milliseconds, so drawing never reads the wall clock
         if not self.is_alive:
             return
+        x, y = self.position(alpha)
+
+        sprites = self.sprites.ensure_built()
 
         # Draw dash particles
-        for x, y, life in self.dash_particles:
-            alpha = int(255 * (life / 20))
-            particle_color = (*self.color[:3], alpha)
-            particle_surface = pygame.Surface((8, 8), pygame.SRCALPHA)
-            pygame.draw.circle(particle_surface, particle_color, (4, 4), 4)
-            surface.blit(particle_surface, (int(x), int(y)))
+        self.particles.draw(surface, DASH_PARTICLE, alpha=alpha)
 
         # Draw dash trail
         if self.is_dashing:
-            for i in range(5):
-                alpha = int(255 * (1 - i/5))
-                trail_color = (*self.color[:3], alpha)
-                trail_surface = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
-                pygame.draw.rect(trail_surface, trail_color, (0, 0, self.width, self.height), border_radius=5)
+            for i, trail_surface in enumerate(sprites.dash_trail):
                 offset = -i * 10 * self.dash_direction
-                surface.blit(trail_surface, (self.x + offset, self.y))
+                surface.blit(trail_surface, (x + offset, y))
 
         # Draw landing particles
-        for x, y, life in self.landing_particles:
-            alpha = int(255 * (life / 20))
-            particle_color = (*self.color[:3], alpha)
-            particle_surface = pygame.Surface((6, 6), pygame.SRCALPHA)
-            pygame.draw.circle(particle_surface, particle_color, (3, 3), 3)
-            surface.blit(particle_surface, (int(x), int(y)))
-
-        # Update glow effect
-        self.glow_radius += 0.2 * self.glow_direction
-        if self.glow_radius > 5 or self.glow_radius < 0:
-            self.glow_direction *= -1
+        self.particles.draw(surface, LANDING_PARTICLE, alpha=alpha)
 
         # Draw trail with gradient
         for i, (trail_x, trail_y) in enumerate(self.trail):
-            alpha = int(255 * (i / len(self.trail)))
-            trail_color = (*self.color[:3], alpha)
-            trail_surface = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
-            
-            # Draw trail with glow
-            glow_surface = pygame.Surface((self.width + 10, self.height + 10), pygame.SRCALPHA)
-            pygame.draw.rect(glow_surface, (*self.color[:3], alpha//2), 
-                           (5, 5, self.width, self.height), border_radius=5)
-            surface.blit(glow_surface, (trail_x - 5, trail_y - 5))
-            
-            # Draw trail cube
-            pygame.draw.rect(trail_surface, trail_color, (0, 0, self.width, self.height), border_radius=5)
-            surface.blit(trail_surface, (trail_x, trail_y))
+            step = sprites.trail_step(i, len(self.trail))
+            surface.blit(sprites.trail_glows[step], (trail_x - 5, trail_y - 5))
+            surface.blit(sprites.trail[step], (trail_x, trail_y))
 
         # Draw jump particles
-        for x, y, life in self.jump_particles:
-            alpha = int(255 * (life / 20))
-            particle_color = (*self.color[:3], alpha)
-            particle_surface = pygame.Surface((6, 6), pygame.SRCALPHA)
-            pygame.draw.circle(particle_surface, particle_color, (3, 3), 3)
-            surface.blit(particle_surface, (int(x), int(y)))
-
-        # Draw player with enhanced effects
-        player_surface = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
-        
-        # Enhanced glow effect when powered up
-        glow_color = CYAN if self.has_jump_powerup else self.color
-        glow_alpha = 150 if self.has_jump_powerup else 100
-        glow_size = 15 if self.has_jump_powerup else 10
-        
-        # Draw outer glow
-        glow_surface = pygame.Surface((self.width + glow_size, self.height + glow_size), pygame.SRCALPHA)
-        pygame.draw.rect(glow_surface, (*glow_color[:3], glow_alpha), 
-                        (glow_size//2, glow_size//2, self.width, self.height), border_radius=5)
-        surface.blit(glow_surface, (self.x - glow_size//2, self.y - glow_size//2))
-        
-        # Draw main cube with gradient
-        for i in range(self.height):
-            alpha = int(255 * (1 - i / self.height))
-            color = CYAN if self.has_jump_powerup else self.color
-            color = (*color[:3], alpha)
-            pygame.draw.line(player_surface, color, (0, i), (self.width, i))
-        
-        # Add highlight
-        highlight = pygame.Surface((self.width//2, self.height//2), pygame.SRCALPHA)
-        highlight.fill((255, 255, 255, 100))
-        player_surface.blit(highlight, (self.width//4, self.height//4))
-        
-        # Add corner highlights
-        corner_size = 5
-        highlight_color = (255, 255, 255, 150)
-        pygame.draw.rect(player_surface, highlight_color, 
-                        (0, 0, corner_size, corner_size))
-        pygame.draw.rect(player_surface, highlight_color, 
-                        (self.width - corner_size, 0, corner_size, corner_size))
-        pygame.draw.rect(player_surface, highlight_color, 
-                        (0, self.height - corner_size, corner_size, corner_size))
-        pygame.draw.rect(player_surface, highlight_color, 
-                        (self.width - corner_size, self.height - corner_size, corner_size, corner_size))
+        self.particles.draw(surface, JUMP_PARTICLE, alpha=alpha)
+
+        # Draw outer glow, enhanced when powered up
+        glow_surface, glow_offset = sprites.glows[self.has_jump_powerup]
+        surface.blit(glow_surface, (x - glow_offset, y - glow_offset))
 
         # Add powerup effects
         if self.has_jump_powerup:
             # Add pulsing effect
-            pulse_size = int(5 * math.sin(pygame.time.get_ticks() * 0.01))
-            pulse_surface = pygame.Surface((self.width + pulse_size*2, self.height + pulse_size*2), pygame.SRCALPHA)
-            pygame.draw.rect(pulse_surface, (*CYAN[:3], 50), 
-                           (pulse_size, pulse_size, self.width, self.height), border_radius=5)
-            surface.blit(pulse_surface, (self.x - pulse_size, self.y - pulse_size))
+            pulse_size = int(5 * math.sin(ticks * 0.01))
+            surface.blit(sprites.pulses[pulse_size], (x - pulse_size, y - pulse_size))
             
             # Add sparkle effect
-            if random.random() < 0.3:
-                sparkle_x = self.x + random.randint(0, self.width)
-                sparkle_y = self.y + random.randint(0, self.height)
-                sparkle_surface = pygame.Surface((4, 4), pygame.SRCALPHA)
-                pygame.draw.circle(sparkle_surface, (255, 255, 255, 200), (2, 2), 2)
-                surface.blit(sparkle_surface, (sparkle_x, sparkle_y))
+            if fx_rng.random() < 0.3:
+                sparkle_x = x + fx_rng.randint(0, self.width)
+                sparkle_y = y + fx_rng.randint(0, self.height)
+                surface.blit(sprites.sparkle, (sparkle_x, sparkle_y))
 
-        # Rotate and draw the player
-        rotated_surface = pygame.transform.rotate(player_surface, self.rotation)
-        surface.blit(rotated_surface, (self.x, self.y))
+        # Draw the pre-rotated player
+        surface.blit(sprites.bodies[(self.has_jump_powerup, self.rotation)], (x, y))
 
         # Draw combo counter
         if self.combo > 1:
-            font = pygame.font.Font(None, 24)
-            combo_text = font.render(f"{self.combo}x COMBO!", True, YELLOW)
-            combo_rect = combo_text.get_rect(center=(self.x + self.width//2, self.y - 20))
+            combo_text = text_cache.render(f"{self.combo}x COMBO!", 24, YELLOW)
+            combo_rect = combo_text.get_rect(center=(x + self.width//2, y - 20))
             surface.blit(combo_text, combo_rect)
 
+    def dirty_rects(self, alpha=1.0):
+        if not self.is_alive:
+            return []
+        x, y = self.position(alpha)
+        # Body with its glow and pulse, then everything that trails behind it
+        rect = pygame.Rect(int(x) - 9, int(y) - 9, self.width + 18, self.height + 18)
+        if self.trail:
+            trail_rect = points_rect(self.trail, 5)
+            trail_rect.width += self.width
+            trail_rect.height += self.height
+            rect.union_ip(trail_rect)
+        if self.is_dashing:
+            rect.union_ip(rect.move(-40 * self.dash_direction, 0))
+        particle_rect = self.particles.bounds(alpha)
+        if particle_rect is not None:
+            rect.union_ip(particle_rect)
+        if self.combo > 1:
+            combo_text = text_cache.render(f"{self.combo}x COMBO!", 24, YELLOW)
+            rect.union_ip(combo_text.get_rect(center=(x + self.width//2, y - 20)))
+        return [rect]
+
 class Platform:
-    def __init__(self, x, y, width, height, is_wall=False):
+    __slots__ = ("x", "y", "width", "height")
+    color = GREEN  # Always green, no more red walls
+
+    def __init__(self, x, y, width, height):
         self.x = x
         self.y = y
         self.width = width
         self.height = height
-        self.is_wall = is_wall
-        self.color = GREEN  # Always green, no more red walls
-        self.particles = []
-
-    def update(self):
-        self.x -= SCROLL_SPEED
-        # Update particles
-        self.particles = [p for p in self.particles if p[2] > 0]
-        self.particles = [(x, y, life - 1) for x, y, life in self.particles]
 
-    def draw(self, surface):
-        # Draw platform with gradient
-        platform_surface = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
+    def render_texture(self):
+        platform_surface = new_surface((self.width, self.height), pygame.SRCALPHA)
         for i in range(self.height):
             alpha = int(255 * (1 - i / self.height))
             color = (*self.color[:3], alpha)
             pygame.draw.line(platform_surface, color, (0, i), (self.width, i))
         
         # Add highlight
-        highlight = pygame.Surface((self.width, self.height//3), pygame.SRCALPHA)
+        highlight = new_surface((self.width, self.height//3), pygame.SRCALPHA)
         highlight.fill((255, 255, 255, 50))
         platform_surface.blit(highlight, (0, 0))
+        return platform_surface
 
+    def draw(self, surface):
+        # Draw platform with gradient
+        platform_surface = platform_textures.get((self.width, self.height, self.color), self.render_texture)
         surface.blit(platform_surface, (self.x, self.y))
 
-        # Draw particles
-        for x, y, life in self.particles:
-            alpha = int(255 * (life / 10))
-            particle_color = (*self.color[:3], alpha)
-            pygame.draw.circle(surface, particle_color, (int(x), int(y)), 2)
+    def dirty_rects(self):
+        return [pygame.Rect(int(self.x), int(self.y), self.width + 1, self.height)]
 
 class Spike:
+    __slots__ = ("x", "y", "width", "height")
+    color = YELLOW
+
     def __init__(self, x, y, width=20, height=20):
         self.x = x
         self.y = y
         self.width = width
         self.height = height
-        self.color = YELLOW
-        self.glow_radius = 0
-        self.glow_direction = 1
 
-    def update(self):
-        self.x -= SCROLL_SPEED
-        # Update glow effect
-        self.glow_radius += 0.2 * self.glow_direction
-        if self.glow_radius > 5 or self.glow_radius < 0:
-            self.glow_direction *= -1
-
-    def draw(self, surface):
-        # Draw glow
-        glow_surface = pygame.Surface((self.width + self.glow_radius*2, self.height + self.glow_radius*2), pygame.SRCALPHA)
-        pygame.draw.polygon(glow_surface, (*self.color[:3], 100), [
-            (self.width/2 + self.glow_radius, self.glow_radius),
-            (self.glow_radius, self.height + self.glow_radius),
-            (self.width + self.glow_radius, self.height + self.glow_radius)
-        ])
-        surface.blit(glow_surface, (self.x - self.glow_radius, self.y - self.glow_radius))
+    def draw(self, surface, glow_radius):
+        # Draw glow. Every spike in a game pulses together, see Game.update_spike_glow
+        glow_radius = int(glow_radius)
+        glow_surface = sprite_cache.triangle(self.width, self.height, self.color, 100, padding=glow_radius)
+        surface.blit(glow_surface, (self.x - glow_radius, self.y - glow_radius))
 
         # Draw spike
-        points = [
-            (self.x + self.width/2, self.y),
-            (self.x, self.y + self.height),
-            (self.x + self.width, self.y + self.height)
-        ]
-        pygame.draw.polygon(surface, self.color, points)
+        spike_surface = sprite_cache.triangle(self.width, self.height, self.color)
+        surface.blit(spike_surface, (self.x, self.y))
+
+    def dirty_rects(self):
+        return [pygame.Rect(int(self.x) - 6, int(self.y) - 6, self.width + 13, self.height + 13)]
+
+class TrailFX:
+    # Background bodies that leave a trail, stored as NumPy arrays. Velocities are worked
+    # out at spawn and every body moves in one vectorized step. Trails share a ring
+    # buffer with a row per body, and each trail point is drawn from a stamp table
+    # indexed by (size, point, trail length) that is built once per class.
+    min_size = max_size = 1
+    max_trail = 1
+    stamp_layers = 1
+
+    def __init__(self, capacity, rng, fx_rng):
+        self.capacity = capacity
+        self.rng = rng
+        self.fx_rng = fx_rng  # Draw-time sparkle
+        self.count = 0
+        self.head = 0  # Ring buffer column written by the last update
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.vx = np.zeros(capacity)
+        self.vy = np.zeros(capacity)
+        self.life = np.zeros(capacity, np.int32)
+        self.size = np.zeros(capacity, np.int32)
+        self.trail_length = np.zeros(capacity, np.int32)
+        self.points = np.zeros(capacity, np.int32)  # Trail points recorded so far, up to trail_length
+        self.trail_x = np.zeros((capacity, self.max_trail))
+        self.trail_y = np.zeros((capacity, self.max_trail))
+        self.previous_x = np.zeros(capacity)  # Head positions at the previous tick, for render interpolation
+        self.previous_y = np.zeros(capacity)
+        self.arrays = [self.x, self.y, self.vx, self.vy, self.life, self.size, self.trail_length,
+                       self.points, self.trail_x, self.trail_y, self.previous_x, self.previous_y]
+        self.build_tables()
+        self.warm_heads()
+
+    def __len__(self):
+        return self.count
+
+    def warm_heads(self):
+        pass
 
-class Meteorite:
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
-        self.size = random.randint(5, 10)  # Increased size
-        self.speed = random.uniform(3, 7)  # Increased speed
-        self.angle = random.uniform(-30, 30)  # Angle in degrees
-        self.trail_length = random.randint(15, 25)  # Longer trail
-        self.trail = []
-        self.core_color = (255, 100, 0)  # Orange core
-        self.outer_color = (255, 200, 0)  # Yellow outer glow
-        self.life = 150  # Increased lifetime
-        self.pulse_size = 0
-        self.pulse_direction = 1
+    @classmethod
+    def stamp_key(cls, size, index, length):
+        # Works on scalars and arrays alike
+        return ((size - cls.min_size) * (cls.max_trail + 1) + length) * cls.max_trail + index
 
-    def update(self):
-        # Update position based on angle
-        self.x += self.speed * math.cos(math.radians(self.angle))
-        self.y += self.speed * math.sin(math.radians(self.angle))
-        
-        # Update trail
-        self.trail.append((self.x, self.y))
-        if len(self.trail) > self.trail_length:
-            self.trail.pop(0)
-        
-        # Update pulse effect
-        self.pulse_size += 0.1 * self.pulse_direction
-        if self.pulse_size > 2 or self.pulse_size < 0:
-            self.pulse_direction *= -1
-        
-        self.life -= 1
-
-    def draw(self, surface):
-        # Draw trail with enhanced fiery effect
-        for i, (trail_x, trail_y) in enumerate(self.trail):
-            alpha = int(255 * (i / len(self.trail)))
-            # Create gradient from yellow to orange
-            trail_color = (
-                int(self.outer_color[0] * (i / len(self.trail)) + self.core_color[0] * (1 - i / len(self.trail))),
-                int(self.outer_color[1] * (i / len(self.trail)) + self.core_color[1] * (1 - i / len(self.trail))),
-                int(self.outer_color[2] * (i / len(self.trail)) + self.core_color[2] * (1 - i / len(self.trail))),
-                alpha
-            )
-            trail_size = int(self.size * (i / len(self.trail)))
-            
-            # Draw trail glow with multiple layers
-            for glow_size in range(3, 0, -1):
-                glow_surface = pygame.Surface((trail_size * (glow_size + 1) * 2, trail_size * (glow_size + 1) * 2), pygame.SRCALPHA)
-                glow_alpha = int(alpha * (0.3 / glow_size))
-                glow_color = (*trail_color[:3], glow_alpha)
-                pygame.draw.circle(glow_surface, glow_color, 
-                                 (trail_size * (glow_size + 1), trail_size * (glow_size + 1)), 
-                                 trail_size * (glow_size + 1))
-                surface.blit(glow_surface, (int(trail_x) - trail_size * (glow_size + 1), 
-                                          int(trail_y) - trail_size * (glow_size + 1)))
-            
-            # Draw trail
-            pygame.draw.circle(surface, trail_color, (int(trail_x), int(trail_y)), trail_size)
-        
-        # Draw meteorite with enhanced fiery effect
-        # Outer glow
-        for glow_size in range(4, 0, -1):
-            glow_surface = pygame.Surface((self.size * (glow_size + 1) * 2, self.size * (glow_size + 1) * 2), pygame.SRCALPHA)
-            glow_alpha = int(150 * (0.3 / glow_size))
-            glow_color = (*self.outer_color, glow_alpha)
-            pygame.draw.circle(glow_surface, glow_color, 
-                             (self.size * (glow_size + 1), self.size * (glow_size + 1)), 
-                             self.size * (glow_size + 1))
-            surface.blit(glow_surface, (int(self.x) - self.size * (glow_size + 1), 
-                                      int(self.y) - self.size * (glow_size + 1)))
-        
-        # Core with pulse effect
-        core_size = self.size + self.pulse_size
-        pygame.draw.circle(surface, self.core_color, (int(self.x), int(self.y)), int(core_size))
-        
-        # Add sparkle effect occasionally
-        if random.random() < 0.1:
-            sparkle_size = random.randint(2, 4)
-            sparkle_surface = pygame.Surface((sparkle_size * 4, sparkle_size * 4), pygame.SRCALPHA)
-            pygame.draw.circle(sparkle_surface, (255, 255, 255, 200), 
-                             (sparkle_size * 2, sparkle_size * 2), sparkle_size)
-            surface.blit(sparkle_surface, (int(self.x) - sparkle_size * 2, int(self.y) - sparkle_size * 2))
-
-class ShootingStar:
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
-        self.speed = random.uniform(8, 12)  # Faster than meteorites
-        self.angle = random.uniform(30, 60)  # Changed to positive angles for downward movement
-        self.trail_length = random.randint(20, 30)  # Longer trail
-        self.trail = []
-        self.color = (255, 255, 255)  # White color
-        self.life = 100  # Frames until removal
-        self.size = random.randint(2, 4)  # Smaller than meteorites
+    @classmethod
+    def build_tables(cls):
+        # Sprite, offset and presence of each stamp layer for every possible trail point
+        if "tables" in cls.__dict__:
+            return
+        keys = (cls.max_size - cls.min_size + 1) * (cls.max_trail + 1) * cls.max_trail
+        sprites = np.full((keys, cls.stamp_layers), None, dtype=object)
+        offsets = np.zeros((keys, cls.stamp_layers), np.int32)
+        present = np.zeros((keys, cls.stamp_layers), bool)
+        for size in range(cls.min_size, cls.max_size + 1):
+            for length in range(1, cls.max_trail + 1):
+                for index in range(length):
+                    key = cls.stamp_key(size, index, length)
+                    for layer, (sprite, offset) in enumerate(cls.trail_stamp(size, index, length)):
+                        sprites[key, layer] = sprite
+                        offsets[key, layer] = offset
+                        present[key, layer] = True
+        cls.tables = (sprites, offsets, present)
+
+    def add(self, x, y, speed, angle, size, trail_length, life):
+        # Returns the new body's slot, or None if the system is full
+        if self.count == self.capacity:
+            return None
+        index = self.count
+        self.x[index] = self.previous_x[index] = x
+        self.y[index] = self.previous_y[index] = y
+        self.vx[index] = speed * math.cos(math.radians(angle))
+        self.vy[index] = speed * math.sin(math.radians(angle))
+        self.size[index] = size
+        self.trail_length[index] = trail_length
+        self.life[index] = life
+        self.points[index] = 0
+        self.count += 1
+        return index
 
     def update(self):
-        # Update position based on angle
-        self.x += self.speed * math.cos(math.radians(self.angle))
-        self.y += self.speed * math.sin(math.radians(self.angle))
-        
-        # Update trail
-        self.trail.append((self.x, self.y))
-        if len(self.trail) > self.trail_length:
-            self.trail.pop(0)
-        
-        self.life -= 1
+        count = self.count
+        self.previous_x[:count] = self.x[:count]
+        self.previous_y[:count] = self.y[:count]
+        self.x[:count] += self.vx[:count]
+        self.y[:count] += self.vy[:count]
+        # Record the new positions in the next ring column
+        self.head = (self.head + 1) % self.max_trail
+        self.trail_x[:count, self.head] = self.x[:count]
+        self.trail_y[:count, self.head] = self.y[:count]
+        np.minimum(self.points[:count] + 1, self.trail_length[:count], out=self.points[:count])
+        self.life[:count] -= 1
+        self.cull()
+
+    def on_screen(self, x, y):
+        return np.ones(len(x), bool)
+
+    def cull(self):
+        # Swap-remove bodies that expired or left the screen
+        count = self.count
+        alive = self.on_screen(self.x[:count], self.y[:count]) & (self.life[:count] > 0)
+        alive_count = int(np.count_nonzero(alive))
+        if alive_count == count:
+            return
+        holes = np.flatnonzero(~alive[:alive_count])
+        movers = np.flatnonzero(alive[alive_count:]) + alive_count
+        for array in self.arrays:
+            array[holes] = array[movers]
+        self.count = alive_count
+
+    def lag(self, alpha):
+        # How far each body is drawn behind its latest position, alpha of the way from the
+        # previous tick to this one. The whole trail moves with its head.
+        count = self.count
+        return ((self.previous_x[:count] - self.x[:count]) * (1 - alpha),
+                (self.previous_y[:count] - self.y[:count]) * (1 - alpha))
+
+    def heads(self, alpha):
+        lag_x, lag_y = self.lag(alpha)
+        return self.x[:self.count] + lag_x, self.y[:self.count] + lag_y
+
+    def trail(self, alpha=1.0):
+        # Trail points oldest first as (bodies, max_trail) arrays, with a mask of the recorded ones
+        count = self.count
+        points = self.points[:count, None]
+        index = np.arange(self.max_trail)
+        columns = (self.head - points + 1 + index) % self.max_trail
+        rows = np.arange(count)[:, None]
+        keys = self.stamp_key(self.size[:count, None], index, points)
+        lag_x, lag_y = self.lag(alpha)
+        return (self.trail_x[rows, columns] + lag_x[:, None], self.trail_y[rows, columns] + lag_y[:, None],
+                keys, index < points)
+
+    def draw_trails(self, surface, alpha=1.0):
+        if self.count == 0:
+            return
+        xs, ys, keys, valid = self.trail(alpha)
+        keys = keys[valid]
+        sprites, offsets, present = self.tables
+        present = present[keys]
+        dest_x = (xs[valid].astype(np.int32)[:, None] - offsets[keys])[present]
+        dest_y = (ys[valid].astype(np.int32)[:, None] - offsets[keys])[present]
+        surface.blits(zip(sprites[keys][present].tolist(), zip(dest_x.tolist(), dest_y.tolist())), doreturn=False)
+
+    def rects(self, alpha=1.0):
+        # One rect per body around its whole trail, grown by each body's glow reach
+        if self.count == 0:
+            return []
+        xs, ys, _, valid = self.trail(alpha)
+        xs = xs.astype(np.int32)
+        ys = ys.astype(np.int32)
+        far = np.iinfo(np.int32).max
+        left = np.where(valid, xs, far).min(1)
+        top = np.where(valid, ys, far).min(1)
+        right = np.where(valid, xs, -far).max(1)
+        bottom = np.where(valid, ys, -far).max(1)
+        pad = self.glow_reach(self.size[:self.count])
+        return [pygame.Rect(l - p, t - p, r - l + p * 2 + 1, b - t + p * 2 + 1) for l, t, r, b, p in
+                zip(left.tolist(), top.tolist(), right.tolist(), bottom.tolist(), pad.tolist())]
+
+class Meteorites(TrailFX):
+    # Colors come from the "meteor" glow ramp
+    min_size, max_size = 5, 10
+    max_trail = 25
+    stamp_layers = 4
+    max_pulse = 2  # The core pulses from its size up to this much bigger
+    sparkle_sizes = (2, 4)
+
+    def __init__(self, capacity, rng, fx_rng):
+        TrailFX.__init__(self, capacity, rng, fx_rng)
+        self.pulse_size = np.zeros(capacity)
+        self.pulse_direction = np.ones(capacity)
+        self.arrays += [self.pulse_size, self.pulse_direction]
+
+    def spawn(self, x, y):
+        rng = self.rng
+        size = rng.randint(5, 10)  # Increased size
+        speed = rng.uniform(3, 7)  # Increased speed
+        angle = rng.uniform(-30, 30)  # Angle in degrees
+        trail_length = rng.randint(15, 25)  # Longer trail
+        index = self.add(x, y, speed, angle, size, trail_length, 150)  # Increased lifetime
+        if index is not None:
+            self.pulse_size[index] = 0
+            self.pulse_direction[index] = 1
 
-    def draw(self, surface):
-        # Draw trail with enhanced glow
-        for i, (trail_x, trail_y) in enumerate(self.trail):
-            alpha = int(255 * (i / len(self.trail)))
-            trail_color = (*self.color, alpha)
-            trail_size = int(self.size * (i / len(self.trail)))
-            
-            # Draw trail glow
-            glow_surface = pygame.Surface((trail_size * 4, trail_size * 4), pygame.SRCALPHA)
-            pygame.draw.circle(glow_surface, (*self.color, alpha//2), 
-                             (trail_size * 2, trail_size * 2), trail_size * 2)
-            surface.blit(glow_surface, (int(trail_x) - trail_size * 2, int(trail_y) - trail_size * 2))
-            
-            # Draw trail
-            pygame.draw.circle(surface, trail_color, (int(trail_x), int(trail_y)), trail_size)
-        
-        # Draw star with enhanced glow
-        glow_surface = pygame.Surface((self.size * 6, self.size * 6), pygame.SRCALPHA)
-        pygame.draw.circle(glow_surface, (*self.color, 150), 
-                         (self.size * 3, self.size * 3), self.size * 3)
-        surface.blit(glow_surface, (int(self.x) - self.size * 3, int(self.y) - self.size * 3))
-        
-        # Draw star
-        pygame.draw.circle(surface, self.color, (int(self.x), int(self.y)), self.size)
+    def update(self):
+        # Update pulse effect
+        count = self.count
+        self.pulse_size[:count] += 0.1 * self.pulse_direction[:count]
+        turn = (self.pulse_size[:count] > self.max_pulse) | (self.pulse_size[:count] < 0)
+        self.pulse_direction[:count][turn] *= -1
+        TrailFX.update(self)
+
+    def on_screen(self, x, y):
+        return (x > -100) & (y < HEIGHT + 100)
+
+    def warm_heads(self):
+        # Glow, pulsing core and sparkle sprites for every size, so nothing is drawn mid-game
+        for size in range(self.min_size, self.max_size + 1):
+            Meteorites.core_stamp(size)
+        for size in range(self.min_size, self.max_size + self.max_pulse + 1):
+            glow_bank.sprite("meteor", size, 0, 255)
+        for size in range(self.sparkle_sizes[0], self.sparkle_sizes[1] + 1):
+            glow_bank.sprite("star", size, 0, 200)
+
+    def glow_reach(self, size):
+        # The core glow reaches 5x the size, trail glows never reach further
+        return size * 5 + 1
+
+    @staticmethod
+    def trail_stamp(size, index, length):
+        t = index / length
+        trail_size = int(size * t)
+        if trail_size == 0:
+            return ()
+        alpha = int(255 * t)
+        # Gradient from orange to yellow along the trail
+        position = glow_bank.ramp_position(t)
+        stamp = []
+        # Trail glow with multiple layers
+        for glow_size in range(3, 0, -1):
+            glow_alpha = int(alpha * (0.3 / glow_size))
+            offset = trail_size * (glow_size + 1)
+            stamp.append((glow_bank.sprite("meteor", trail_size, glow_size, glow_alpha, position), offset))
+        stamp.append((glow_bank.sprite("meteor", trail_size, 0, 255, position), trail_size))
+        return stamp
+
+    @staticmethod
+    def core_stamp(size):
+        def build():
+            # Outer glow in four layers
+            return tuple((glow_bank.sprite("meteor", size, glow_size, int(150 * (0.3 / glow_size)), glow_bank.ramp_steps - 1),
+                          size * (glow_size + 1)) for glow_size in range(4, 0, -1))
+
+        return glow_bank.stamp(("meteor core", size), build)
+
+    def draw(self, surface, alpha=1.0):
+        # Draw trails with enhanced fiery effect
+        self.draw_trails(surface, alpha)
+
+        count = self.count
+        xs, ys = self.heads(alpha)
+        for x, y, size, pulse_size in zip(xs.astype(np.int32).tolist(), ys.astype(np.int32).tolist(),
+                                          self.size[:count].tolist(), self.pulse_size[:count].tolist()):
+            # Draw meteorite with enhanced fiery effect
+            for sprite, offset in Meteorites.core_stamp(size):
+                surface.blit(sprite, (x - offset, y - offset))
+
+            # Core with pulse effect
+            core_size = int(size + pulse_size)
+            surface.blit(glow_bank.sprite("meteor", core_size, 0, 255), (x - core_size, y - core_size))
+
+            # Add sparkle effect occasionally
+            if self.fx_rng.random() < 0.1:
+                sparkle_size = self.fx_rng.randint(*self.sparkle_sizes)
+                sparkle_surface = glow_bank.sprite("star", sparkle_size, 0, 200)
+                surface.blit(sparkle_surface, (x - sparkle_size, y - sparkle_size))
+
+class ShootingStars(TrailFX):
+    # Colors come from the white "star" glow ramp
+    min_size, max_size = 2, 4
+    max_trail = 30
+    stamp_layers = 2
+
+    def spawn(self, x, y):
+        rng = self.rng
+        speed = rng.uniform(8, 12)  # Faster than meteorites
+        angle = rng.uniform(30, 60)  # Changed to positive angles for downward movement
+        trail_length = rng.randint(20, 30)  # Longer trail
+        size = rng.randint(2, 4)  # Smaller than meteorites
+        self.add(x, y, speed, angle, size, trail_length, 100)  # Frames until removal
+
+    def on_screen(self, x, y):
+        return (y < HEIGHT + 50) & (x < WIDTH + 50)
+
+    def warm_heads(self):
+        for size in range(self.min_size, self.max_size + 1):
+            glow_bank.sprite("star", size, 2, 150)
+            glow_bank.sprite("star", size, 0, 255)
+
+    def glow_reach(self, size):
+        return size * 3 + 1
+
+    @staticmethod
+    def trail_stamp(size, index, length):
+        t = index / length
+        trail_size = int(size * t)
+        if trail_size == 0:
+            return ()
+        alpha = int(255 * t)
+        return ((glow_bank.sprite("star", trail_size, 1, alpha//2), trail_size * 2),
+                (glow_bank.sprite("star", trail_size, 0, 255), trail_size))
+
+    def draw(self, surface, alpha=1.0):
+        # Draw trails with enhanced glow
+        self.draw_trails(surface, alpha)
+
+        count = self.count
+        xs, ys = self.heads(alpha)
+        for x, y, size in zip(xs.astype(np.int32).tolist(), ys.astype(np.int32).tolist(), self.size[:count].tolist()):
+            # Draw star with enhanced glow
+            glow_surface = glow_bank.sprite("star", size, 2, 150)
+            surface.blit(glow_surface, (x - size * 3, y - size * 3))
+
+            # Draw star
+            surface.blit(glow_bank.sprite("star", size, 0, 255), (x - size, y - size))
 
 class Spaceship:
-    def __init__(self, x, y):
+    def __init__(self, x, y, rng=None):
         self.x = x
+        self.previous_x = x  # Position at the previous tick, for render interpolation
         self.y = y
         self.width = 60
         self.height = 30
         self.color = (100, 200, 255)
         self.engine_color = (255, 200, 100)
-        self.engine_particles = []
         self.max_engine_particles = 20
+        self.engine_particles = ParticleEngine(self.max_engine_particles, [self.engine_color], rng)
         self.is_active = False
-        self.travel_distance = 500  # Distance to skip
-        self.travel_speed = 10
+        self.travel_distance = SPACESHIP_DISTANCE  # Distance to skip
+        self.travel_speed = SPACESHIP_SPEED
         self.travel_progress = 0
         self.glow_radius = 0
         self.glow_direction = 1
@@ -748,6 +1820,8 @@ class Spaceship:
         self.pulse_direction = 1
 
     def update(self):
+        self.previous_x = self.x
+
         # Update glow effect
         self.glow_radius += 0.2 * self.glow_direction
         if self.glow_radius > 5 or self.glow_radius < 0:
@@ -761,36 +1835,19 @@ class Spaceship:
         # Update engine particles
         if self.is_active:
             # Create new engine particles
-            if random.random() < 0.3:
-                self.engine_particles.append((
-                    self.x - 10,
-                    self.y + random.randint(0, self.height),
-                    random.randint(10, 20)
-                ))
+            rng = self.engine_particles.rng
+            if rng.random() < 0.3:
+                self.engine_particles.emit(1, self.x - 10, self.y + rng.integers(0, self.height + 1),
+                                           rng.integers(10, 21), vx=-5, size=4)
             # Move forward
             self.x += self.travel_speed
             self.travel_progress += self.travel_speed
 
         # Update existing particles
-        self.engine_particles = [(x - 5, y, life - 1) for x, y, life in self.engine_particles if life > 0]
+        self.engine_particles.update()
 
-    def draw(self, surface):
-        # Draw engine particles
-        for x, y, life in self.engine_particles:
-            alpha = int(255 * (life / 20))
-            particle_color = (*self.engine_color[:3], alpha)
-            particle_surface = pygame.Surface((8, 8), pygame.SRCALPHA)
-            pygame.draw.circle(particle_surface, particle_color, (4, 4), 4)
-            surface.blit(particle_surface, (int(x), int(y)))
-
-        # Draw glow
-        glow_surface = pygame.Surface((self.width + 20, self.height + 20), pygame.SRCALPHA)
-        glow_color = (*self.color[:3], 100)
-        pygame.draw.rect(glow_surface, glow_color, (10, 10, self.width, self.height), border_radius=10)
-        surface.blit(glow_surface, (self.x - 10, self.y - 10))
-
-        # Draw main body
-        ship_surface = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
+    def render_body(self):
+        ship_surface = new_surface((self.width, self.height), pygame.SRCALPHA)
         pygame.draw.rect(ship_surface, self.color, (0, 0, self.width, self.height), border_radius=5)
         
         # Add cockpit
@@ -808,101 +1865,116 @@ class Spaceship:
             (3*self.width//4, self.height//2),
             (3*self.width//4, self.height)
         ])
+        return ship_surface
 
-        # Add pulse effect
-        if not self.is_active:
-            pulse_surface = pygame.Surface((self.width + self.pulse_size*2, self.height + self.pulse_size*2), pygame.SRCALPHA)
-            pygame.draw.rect(pulse_surface, (*self.color[:3], 50), 
-                           (self.pulse_size, self.pulse_size, self.width, self.height), border_radius=5)
-            surface.blit(pulse_surface, (self.x - self.pulse_size, self.y - self.pulse_size))
+    def draw(self, surface, alpha=1.0):
+        x = self.previous_x + (self.x - self.previous_x) * alpha
 
-        surface.blit(ship_surface, (self.x, self.y))
+        # Draw engine particles
+        self.engine_particles.draw(surface, alpha=alpha)
 
-class Game:
+        # Draw glow
+        glow_surface = sprite_cache.rect(self.width, self.height, self.color, 100, border_radius=10, padding=10)
+        surface.blit(glow_surface, (x - 10, self.y - 10))
+
+        # Draw main body
+        ship_surface = sprite_cache.get(("spaceship", self.width, self.height, self.color), self.render_body)
+
+        # Add pulse effect
+        if not self.is_active:
+            pulse_size = int(self.pulse_size)
+            pulse_surface = sprite_cache.rect(self.width, self.height, self.color, 50, border_radius=5, padding=pulse_size)
+            surface.blit(pulse_surface, (x - pulse_size, self.y - pulse_size))
+
+        surface.blit(ship_surface, (x, self.y))
+
+    def dirty_rects(self, alpha=1.0):
+        x = self.previous_x + (self.x - self.previous_x) * alpha
+        rect = pygame.Rect(int(x) - 10, int(self.y) - 10, self.width + 21, self.height + 21)
+        particle_rect = self.engine_particles.bounds(alpha)
+        if particle_rect is not None:
+            rect.union_ip(particle_rect)
+        return [rect]
+
+class LevelChunk:
+    # One stretch of level, in world coordinates, left to right. Spaceships are only
+    # (x, y) here since they are built in screen space when the chunk is placed.
     def __init__(self):
-        self.player = Player()
         self.platforms = []
         self.spikes = []
         self.monsters = []
         self.powerups = []
-        self.score = 0
-        self.game_over = False
-        self.background = pygame.Surface((WIDTH, HEIGHT))
-        self.generate_background()
-        self.generate_initial_platforms()
-        self.particles = []
-        self.max_particles = 100
-        self.meteorites = []
-        self.last_meteorite_time = 0
-        self.meteorite_delay = 1000
-        self.shooting_stars = []
-        self.last_shooting_star_time = 0
-        self.shooting_star_delay = 2000
-        self.screen_shake = 0
-        self.high_score = 0
-        self.is_paused = False
-        self.tutorial_step = 0
-        self.tutorial_timer = 0
-        self.tutorial_messages = [
-            "Use LEFT and RIGHT to move",
-            "Press SPACE to jump",
-            "Press SHIFT to dash",
-            "Collect powerups for higher jumps",
-            "Avoid spikes and monsters",
-            "Chain jumps for combos!"
-        ]
-        self.particle_system = []
-        self.max_particles = 200
-        self.background_particles = []
-        self.max_background_particles = 100
         self.spaceships = []
-        self.spaceship_delay = 10000
-        self.last_spaceship_time = 0
-        self.combo_font = pygame.font.Font(None, 48)
-        self.powerup_spawn_chance = 0.2
-
-        # Initialize music
-        self.music_playing = False
-        self.start_music()
-
-    def start_music(self):
-        if not self.music_playing:
-            # Generate a simple synth space music
-            pygame.mixer.music.load("space_synth.mp3")  # You'll need to create this file
-            pygame.mixer.music.set_volume(0.5)  # Set volume to 50%
-            pygame.mixer.music.play(-1)  # -1 means loop indefinitely
-            self.music_playing = True
-
-    def stop_music(self):
-        if self.music_playing:
-            pygame.mixer.music.stop()
-            self.music_playing = False
-
-    def generate_background(self):
-        # Create gradient background
-        for y in range(HEIGHT):
-            # Create a more interesting gradient
-            r = int(10 + (y / HEIGHT) * 20)  # Dark blue to slightly lighter
-            g = int(20 + (y / HEIGHT) * 30)
-            b = int(40 + (y / HEIGHT) * 60)
-            pygame.draw.line(self.background, (r, g, b), (0, y), (WIDTH, y))
-
-        # Add more stars with varying brightness
-        for _ in range(200):  # More stars
-            x = random.randint(0, WIDTH)
-            y = random.randint(0, HEIGHT)
-            size = random.randint(1, 3)
-            brightness = random.randint(50, 255)
-            pygame.draw.circle(self.background, (brightness, brightness, brightness), (x, y), size)
-            
-            # Add some twinkling stars
-            if random.random() < 0.3:
-                glow_size = size + 2
-                pygame.draw.circle(self.background, (brightness, brightness, brightness, 100), (x, y), glow_size)
-
-    def generate_initial_platforms(self):
+        self.end_x = 0  # x of the last platform
+
+class LevelGenerator:
+    # Builds the level a chunk at a time from its own random stream, so the layout only
+    # depends on the seed and not on when chunks are made. With threaded set, a worker
+    # keeps up to LEVEL_QUEUE_CHUNKS chunks ready; otherwise they are made on demand.
+    def __init__(self, seed, threaded=LEVEL_THREAD):
+        self.rng = random.Random(seed)
+        # World distances from the tuning constants, worked out per level so they follow
+        # SCROLL_SPEED when it changes
+        self.monster_start_x = MONSTER_START_SCORE * SCROLL_SPEED + WIDTH + 200
+        self.spaceship_spacing = SPACESHIP_SPACING_TICKS * SCROLL_SPEED
+        self.last_x = 0
+        self.last_y = 0
+        self.last_spaceship_x = -self.spaceship_spacing
+        self.chunks = Queue(LEVEL_QUEUE_CHUNKS)
+        self.chunks.put(self.initial_chunk())
+        self.stopped = threading.Event()
+        self.error = None  # What stopped the worker, if it failed
+        self.worker = None
+        if threaded:
+            self.worker = threading.Thread(target=self.run, daemon=True)
+            self.worker.start()
+
+    def run(self):
+        chunk = None
+        try:
+            while not self.stopped.is_set():
+                if chunk is None:
+                    chunk = self.next_chunk()
+                try:
+                    # Time out now and then to notice stop()
+                    self.chunks.put(chunk, timeout=0.1)
+                    chunk = None
+                except Full:
+                    pass
+        except Exception as error:
+            # Kept for pop() to raise on the game thread
+            self.error = error
+
+    def stop(self):
+        self.stopped.set()
+        if self.worker is not None:
+            # Empty the queue so a worker blocked on put wakes up and sees the flag
+            while self.worker.is_alive():
+                try:
+                    self.chunks.get_nowait()
+                except Empty:
+                    pass
+                self.worker.join(0.001)
+
+    def pop(self):
+        # Next chunk, waiting for the worker if it has fallen behind
+        if self.worker is None:
+            try:
+                return self.chunks.get_nowait()
+            except Empty:
+                return self.next_chunk()
+        while True:
+            try:
+                return self.chunks.get(timeout=0.1)
+            except Empty:
+                # Don't wait forever on a worker that has died
+                if not self.worker.is_alive():
+                    raise RuntimeError("level generator stopped") from self.error
+
+    def initial_chunk(self):
+        chunk = LevelChunk()
         # Start with a ground platform
-        self.platforms.append(Platform(0, HEIGHT - 50, WIDTH, 50))
+        chunk.platforms.append(Platform(0, HEIGHT - 50, WIDTH, 50))
         
         # Create a series of platforms at different elevations
         current_height = HEIGHT - 150  # Start at a reasonable height
@@ -910,131 +1982,392 @@ class Game:
             x = 200 + i * 200
             # Gradually increase height with smaller steps
             if i > 0:
-                height_change = random.choice([-50, 0, 50])  # Smaller height changes
+                height_change = self.rng.choice([-50, 0, 50])  # Smaller height changes
                 current_height = max(HEIGHT - 350, min(HEIGHT - 100, current_height + height_change))
             
             width = 150
-            self.platforms.append(Platform(x, current_height, width, 30))
+            chunk.platforms.append(Platform(x, current_height, width, 30))
             
             # Add some spikes occasionally, but not in the first few platforms
             if i >= 2 and i % 3 == 0:  # Only add spikes after the first 2 platforms
                 spike_x = x + width//2 - 10
-                self.spikes.append(Spike(spike_x, current_height - 20))
+                chunk.spikes.append(Spike(spike_x, current_height - 20))
 
             # Add monsters only after the first few platforms
             if i >= 3 and i % 4 == 0:  # Only add monsters after platform 3
                 monster_x = x + width + 50
-                self.monsters.append(Monster(monster_x, current_height - 50))
+                chunk.monsters.append(Monster(monster_x, current_height - 50))
+
+        self.last_x = chunk.end_x = x
+        self.last_y = current_height
+        return chunk
 
-    def generate_new_platform(self):
+    def next_chunk(self):
         # Generate new platforms with more predictable patterns
-        last_platform = self.platforms[-1]
-        if last_platform.x < WIDTH + 200:
+        chunk = LevelChunk()
+        rng = self.rng
+        end = self.last_x + LEVEL_CHUNK_WIDTH
+        while self.last_x < end:
             # Create a new platform
-            x = last_platform.x + random.randint(150, 200)
+            x = self.last_x + rng.randint(150, 200)
             
             # Calculate new height based on last platform with smaller changes
-            height_change = random.choice([-50, 0, 50])  # Smaller height changes
-            current_height = max(HEIGHT - 350, min(HEIGHT - 100, last_platform.y + height_change))
+            height_change = rng.choice([-50, 0, 50])  # Smaller height changes
+            current_height = max(HEIGHT - 350, min(HEIGHT - 100, self.last_y + height_change))
             
-            width = random.randint(120, 180)
+            width = quantize_platform_width(rng.randint(120, 180))
             
             # Add the platform
-            self.platforms.append(Platform(x, current_height, width, 30))
+            chunk.platforms.append(Platform(x, current_height, width, 30))
             
             # Add monsters first (if any)
             monster_x = None
-            if self.score > 300 and random.random() < 0.25:  # Increased monster frequency to 25% and lowered score threshold
+            if x > self.monster_start_x and rng.random() < MONSTER_CHANCE:
                 monster_x = x + width + 50
-                self.monsters.append(Monster(monster_x, current_height - 50))
+                chunk.monsters.append(Monster(monster_x, current_height - 50))
             
-            # Add powerups (15% chance) but not near monsters
-            if random.random() < 0.15 and (monster_x is None or x + width//2 < monster_x - 100):
+            # Add powerups but not near monsters
+            if rng.random() < POWERUP_CHANCE and (monster_x is None or x + width//2 < monster_x - 100):
                 powerup_x = x + width//2 - 10  # Center on platform
-                self.powerups.append(Powerup(powerup_x, current_height - 40))  # Place above platform
+                chunk.powerups.append(Powerup(powerup_x, current_height - 40))  # Place above platform
             
             # Sometimes add spikes (less frequently)
-            if random.random() < 0.15:  # Reduced spike frequency
-                spike_x = x + random.randint(20, width - 40)
-                self.spikes.append(Spike(spike_x, current_height - 20))
+            if rng.random() < SPIKE_CHANCE:
+                spike_x = x + rng.randint(20, width - 40)
+                chunk.spikes.append(Spike(spike_x, current_height - 20))
 
             # Add spaceship occasionally
-            current_time = pygame.time.get_ticks()
-            if current_time - self.last_spaceship_time > self.spaceship_delay:
-                if random.random() < 0.3:  # 30% chance to spawn a spaceship
-                    spaceship_x = x + width + 100
-                    self.spaceships.append(Spaceship(spaceship_x, current_height - 50))
-                    self.last_spaceship_time = current_time
+            if x - self.last_spaceship_x > self.spaceship_spacing:
+                if rng.random() < SPACESHIP_CHANCE:
+                    chunk.spaceships.append((x + width + 100, current_height - 50))
+                    self.last_spaceship_x = x
+
+            self.last_x = x
+            self.last_y = current_height
+        chunk.end_x = self.last_x
+        return chunk
+
+def disc_offsets(radius):
+    # Pixel offsets pygame.draw.circle fills for a radius, so the vectorized starfield
+    # rasterizes stars exactly like the drawn one did
+    size = radius * 2 + 3
+    stamp = new_surface((size, size))
+    pygame.draw.circle(stamp, WHITE, (radius + 1, radius + 1), radius)
+    xs, ys = np.nonzero(pygame.surfarray.array_red(stamp))
+    return xs - (radius + 1), ys - (radius + 1)
+
+def background_pixels(seed):
+    # Gradient and starfield as a (WIDTH, HEIGHT, 3) array, rolled from the seed alone
+    rng = np.random.default_rng(seed)
+    fade = np.arange(HEIGHT) / HEIGHT
+    gradient = np.stack([10 + fade * 20, 20 + fade * 30, 40 + fade * 60], axis=1).astype(np.uint8)
+    pixels = np.empty((WIDTH, HEIGHT, 3), np.uint8)
+    pixels[:] = gradient
+
+    # Stars of varying brightness, some with a wider glow
+    xs = rng.integers(0, WIDTH, BACKGROUND_STARS, endpoint=True)
+    ys = rng.integers(0, HEIGHT, BACKGROUND_STARS, endpoint=True)
+    sizes = rng.integers(1, 3, BACKGROUND_STARS, endpoint=True)
+    brightness = rng.integers(50, 255, BACKGROUND_STARS, endpoint=True).astype(np.uint8)
+    sizes += np.where(rng.random(BACKGROUND_STARS) < 0.3, 2, 0)
+
+    # Every star's disc in one array, in draw order
+    discs = {radius: disc_offsets(radius) for radius in np.unique(sizes).tolist()}
+    star_x = []
+    star_y = []
+    star_index = []
+    for index, radius in enumerate(sizes.tolist()):
+        dx, dy = discs[radius]
+        star_x.append(dx + xs[index])
+        star_y.append(dy + ys[index])
+        star_index.append(np.full(len(dx), index))
+    star_x = np.concatenate(star_x)
+    star_y = np.concatenate(star_y)
+    star_index = np.concatenate(star_index)
+    inside = (star_x >= 0) & (star_x < WIDTH) & (star_y >= 0) & (star_y < HEIGHT)
+    star_x, star_y, star_index = star_x[inside], star_y[inside], star_index[inside]
+
+    # Where stars overlap the later one is on top, same as drawing them in order
+    flat = (star_x * HEIGHT + star_y)[::-1]
+    flat, last = np.unique(flat, return_index=True)
+    pixels.reshape(-1, 3)[flat] = brightness[star_index[::-1][last], None]
+    return pixels
+
+def save_background(path, pixels):
+    # Best effort: a read-only install just regenerates the background every start
+    try:
+        os.makedirs(BACKGROUND_CACHE_DIR, exist_ok=True)
+        # Surfaces are stored row by row, the array is column by column
+        data = np.ascontiguousarray(pixels.transpose(1, 0, 2)).tobytes()
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as cached:
+            cached.write(data)
+        os.replace(temporary, path)
+        # Drop the oldest backgrounds beyond the limit
+        names = [os.path.join(BACKGROUND_CACHE_DIR, name) for name in os.listdir(BACKGROUND_CACHE_DIR)
+                 if name.startswith("background-")]
+        names.sort(key=os.path.getmtime)
+        for stale in names[:-BACKGROUND_CACHE_FILES]:
+            os.remove(stale)
+    except OSError:
+        pass
+
+class Game:
+    def __init__(self, headless=False, seed=None, fx_density=FX_DENSITY, level_thread=LEVEL_THREAD,
+                 effects=True):
+        # Headless games skip audio
+        self.headless = headless
+        self.audio_enabled = not headless
+        # Particles, meteorites and shooting stars are only for show. Games nobody watches can
+        # skip them: the run plays out the same, but they stop drawing from self.rng, so the
+        # levels after a restart differ.
+        self.effects = effects
+        self.frame = 0  # Ticks simulated, the game's only clock
+        # Everything the simulation rolls comes from these, so the seed plus the inputs
+        # passed to step() reproduce a run exactly
+        self.seed = seed if seed is not None else random.randrange(2**32)
+        self.rng = random.Random(self.seed)
+        self.np_rng = np.random.default_rng(self.seed)
+        # Draw-time randomness gets its own stream so the frame rate can't change the game
+        self.fx_rng = random.Random(self.seed + 1)
+        # Platforms, spikes, monsters, powerups and spaceships are in world coordinates and the
+        # camera scrolls past them. The player and effects are in screen space.
+        self.camera_x = 0
+        self.previous_camera_x = 0  # Camera at the previous tick, for render interpolation
+        self.scroll_speed = SCROLL_SPEED
+        # Broadphase buckets. Static geometry is indexed once when it spawns.
+        self.platform_grid = SpatialGrid()
+        self.spike_grid = SpatialGrid()
+        self.powerup_grid = SpatialGrid()
+        self.spaceship_grid = SpatialGrid()
+        self.projectiles = ProjectilePool()
+        self.player = Player(self.np_rng, self.effects)
+        self.platforms = []
+        self.spikes = []
+        self.monsters = []
+        self.powerups = []
+        self.spaceships = []
+        self.score = 0
+        self.game_over = False
+        # Every spike pulses together, so the glow is tracked once per game
+        self.spike_glow_radius = 0
+        self.spike_glow_direction = 1
+        self.background = None  # Made on the first draw, so runs that never draw skip it
+        self.level_thread = level_thread
+        self.level = None
+        with startup.phase("level"):
+            self.start_level()
+        # Meteorites and shooting stars render all their glows up front so spawns never allocate
+        self.fx_density = fx_density
+        fx_scale = max(1, fx_density)
+        self.meteorites = Meteorites(int(METEOR_CAPACITY * fx_scale), self.rng, self.fx_rng)
+        self.last_meteorite_time = 0
+        self.meteorite_delay = 1000
+        self.shooting_stars = ShootingStars(int(SHOOTING_STAR_CAPACITY * fx_scale), self.rng, self.fx_rng)
+        self.last_shooting_star_time = 0
+        self.shooting_star_delay = 2000
+        self.screen_shake = 0
+        self.high_score = 0
+        self.is_paused = False
+        self.tutorial_step = 0
+        self.tutorial_timer = 0
+        self.tutorial_messages = [
+            "Use LEFT and RIGHT to move",
+            "Press SPACE to jump",
+            "Press SHIFT to dash",
+            "Collect powerups for higher jumps",
+            "Avoid spikes and monsters",
+            "Chain jumps for combos!"
+        ]
+        self.max_particles = 200
+        self.max_background_particles = 100
+        # Drifting white specks, plus a general effects layer drawn above the HUD
+        self.particles = ParticleEngine(self.max_particles, [WHITE], self.np_rng)
+        self.particle_system = ParticleEngine(self.max_particles, [WHITE, YELLOW, CYAN, ORANGE, MAGENTA, PURPLE], self.np_rng)
+        # Twinkling background particles pick from a palette of random pastel colors
+        palette = [tuple(color) for color in self.np_rng.integers(100, 256, (32, 3)).tolist()]
+        self.background_particles = ParticleEngine(self.max_background_particles, palette, self.np_rng)
+        self.combo_font = fonts.get(48)
+        self.use_dirty_rects = DIRTY_RECT_RENDERING
+        self.previous_rects = None  # Rects drawn last frame, None forces a full redraw
+        self.render_queue = RenderQueue()
+
+        # Initialize music
+        self.music_playing = False
+        self.start_music()
+
+    def ticks(self):
+        # Milliseconds of game time, used for spawn timing
+        return self.frame * 1000 // TICK_RATE
+
+    def start_music(self):
+        if self.audio_enabled and not self.music_playing:
+            soundtrack.play()  # Plays once the worker has loaded it
+            self.music_playing = True
+
+    def stop_music(self):
+        if self.music_playing:
+            soundtrack.stop()
+            self.music_playing = False
+
+    def generate_background(self):
+        # Backgrounds only depend on the resolution and BACKGROUND_SEED, so they are saved
+        # as raw pixels and loaded straight back on later starts
+        self.background = new_surface((WIDTH, HEIGHT))
+        name = f"background-v{BACKGROUND_VERSION}-{WIDTH}x{HEIGHT}-{BACKGROUND_SEED}.rgb"
+        path = os.path.join(BACKGROUND_CACHE_DIR, name)
+        try:
+            with open(path, "rb") as cached:
+                data = cached.read()
+        except OSError:
+            data = None
+        if data is not None and len(data) == WIDTH * HEIGHT * 3:
+            profiler.count_alloc()  # frombuffer wraps the bytes in a surface of its own
+            self.background.blit(pygame.image.frombuffer(data, (WIDTH, HEIGHT), "RGB"), (0, 0))
+            return
+        pixels = background_pixels(BACKGROUND_SEED)
+        pygame.surfarray.blit_array(self.background, pixels)
+        save_background(path, pixels)
+
+    def start_level(self):
+        # A fresh generator per run, seeded from the game's stream so restarts don't
+        # repeat the layout and replays still see the same one
+        if self.level is not None:
+            self.level.stop()
+        self.level = LevelGenerator(self.rng.randrange(2**32), self.level_thread)
+        self.level_end_x = 0
+        self.pull_level()
+
+    def pull_level(self):
+        # Take ready-made chunks only once the camera gets close to the end of the level
+        while self.level_end_x - self.camera_x < WIDTH + 200:
+            self.add_chunk(self.level.pop())
+
+    def add_chunk(self, chunk):
+        for platform in chunk.platforms:
+            self.spawn(self.platforms, self.platform_grid, platform)
+        for spike in chunk.spikes:
+            self.spawn(self.spikes, self.spike_grid, spike)
+        for powerup in chunk.powerups:
+            self.spawn(self.powerups, self.powerup_grid, powerup)
+        self.monsters.extend(chunk.monsters)
+        for x, y in chunk.spaceships:
+            self.spawn(self.spaceships, self.spaceship_grid, Spaceship(x, y, self.np_rng))
+        self.level_end_x = chunk.end_x
+
+    def fx_spawn_count(self):
+        # How many meteorites or shooting stars one spawn makes at the current density
+        whole, fraction = divmod(self.fx_density, 1)
+        return int(whole) + (1 if fraction and self.rng.random() < fraction else 0)
+
+    def spawn(self, entities, grid, entity):
+        entities.append(entity)
+        grid.insert(entity, entity.x, entity.x + entity.width)
+
+    def despawn(self, entities, grid, entity):
+        entities.remove(entity)
+        grid.remove(entity, entity.x, entity.x + entity.width)
+
+    def cull_behind(self, entities, grid=None):
+        # Entities spawn left to right, so only the ones starting left of the camera
+        # need checking, the rest of the list can't have scrolled off yet
+        passed = []
+        for entity in entities:
+            if entity.x >= self.camera_x:
+                break
+            if entity.x + entity.width <= self.camera_x:
+                passed.append(entity)
+        for entity in passed:
+            entities.remove(entity)
+            if grid is not None:
+                grid.remove(entity, entity.x, entity.x + entity.width)
 
     def update(self):
+        # One fixed tick of the simulation. Positions from the end of the last tick are kept
+        # so frames drawn between ticks can interpolate.
+        self.previous_camera_x = self.camera_x
+        self.player.previous_x = self.player.x
+        self.player.previous_y = self.player.y
         if self.is_paused:
             return
+        self.frame += 1
 
         # Update screen shake
         if self.screen_shake > 0:
             self.screen_shake -= 1
 
         if not self.game_over and self.player.is_alive:
-            # Update all game objects
-            for platform in self.platforms:
-                platform.update()
-            for spike in self.spikes:
-                spike.update()
-            for monster in self.monsters:
-                monster.update(self.player.x + self.player.width/2, self.player.y + self.player.height/2)
-            for powerup in self.powerups:
-                powerup.update()
-
-            # Update background particles
-            self.particles = [(x - 1, y, life - 1) for x, y, life in self.particles if life > 0]
-            
-            # Add new particles occasionally
-            if random.random() < 0.1 and len(self.particles) < self.max_particles:
-                self.particles.append((
-                    WIDTH,
-                    random.randint(0, HEIGHT),
-                    random.randint(30, 60)
-                ))
-
-            # Update meteorites
-            current_time = pygame.time.get_ticks()
-            if current_time - self.last_meteorite_time > self.meteorite_delay:
-                # Create new meteorite with wider spawn area
-                start_x = random.randint(WIDTH, WIDTH + 200)  # Increased spawn area
-                start_y = random.randint(-50, HEIGHT//2)  # Allow spawning above screen
-                self.meteorites.append(Meteorite(start_x, start_y))
-                self.last_meteorite_time = current_time
-            
-            # Update existing meteorites
-            for meteorite in self.meteorites:
-                meteorite.update()
-            
-            # Remove meteorites that are off screen or expired
-            self.meteorites = [m for m in self.meteorites if m.x > -100 and m.y < HEIGHT + 100 and m.life > 0]
-
-            # Update shooting stars
-            if current_time - self.last_shooting_star_time > self.shooting_star_delay:
-                # Create new shooting star from top of screen
-                start_x = random.randint(0, WIDTH)
-                start_y = -50  # Start above screen
-                self.shooting_stars.append(ShootingStar(start_x, start_y))
-                self.last_shooting_star_time = current_time
-            
-            # Update existing shooting stars
-            for star in self.shooting_stars:
-                star.update()
-            
-            # Remove shooting stars that are off screen or expired
-            self.shooting_stars = [s for s in self.shooting_stars if s.y < HEIGHT + 50 and s.x < WIDTH + 50 and s.life > 0]
-
-            # Remove objects that are off screen
-            self.platforms = [p for p in self.platforms if p.x + p.width > 0]
-            self.spikes = [s for s in self.spikes if s.x + s.width > 0]
-            self.monsters = [m for m in self.monsters if m.x + m.width > 0]
-            self.powerups = [p for p in self.powerups if not p.collected and p.x + p.width > 0]
-
-            self.player.update(self.platforms, self.spikes, self.monsters, self.powerups)
-            self.generate_new_platform()
+            with profiler.section("entities"):
+                # Scroll the camera instead of moving the world
+                self.camera_x += self.scroll_speed
+
+                # Update all game objects
+                self.update_spike_glow()
+                player_x = self.camera_x + self.player.x + self.player.width/2
+                player_y = self.player.y + self.player.height/2
+                self.projectiles.update(self.scroll_speed)
+                for monster in self.monsters:
+                    monster.update(player_x, player_y, self.projectiles)
+                self.projectiles.cull(self.camera_x)
+                for powerup in self.powerups:
+                    powerup.update(self.ticks())
+
+            if self.effects:
+                with profiler.section("fx"):
+                    # Update background particles
+                    self.particles.update()
+                
+                    # Add new particles occasionally
+                    rng = self.particles.rng
+                    if rng.random() < 0.1:
+                        self.particles.emit(1, WIDTH, rng.integers(0, HEIGHT + 1), rng.integers(30, 61),
+                                            vx=-1, size=1, fade=60)
+
+                    # Update meteorites
+                    current_time = self.ticks()
+                    if current_time - self.last_meteorite_time > self.meteorite_delay:
+                        for _ in range(self.fx_spawn_count()):
+                            # Create new meteorite with wider spawn area
+                            start_x = self.rng.randint(WIDTH, WIDTH + 200)  # Increased spawn area
+                            start_y = self.rng.randint(-50, HEIGHT//2)  # Allow spawning above screen
+                            self.meteorites.spawn(start_x, start_y)
+                        self.last_meteorite_time = current_time
+
+                    # Move meteorites and drop the ones that are off screen or expired
+                    self.meteorites.update()
+
+                    # Update shooting stars
+                    if current_time - self.last_shooting_star_time > self.shooting_star_delay:
+                        for _ in range(self.fx_spawn_count()):
+                            # Create new shooting star from top of screen
+                            start_x = self.rng.randint(0, WIDTH)
+                            start_y = -50  # Start above screen
+                            self.shooting_stars.spawn(start_x, start_y)
+                        self.last_shooting_star_time = current_time
+
+                    # Move shooting stars and drop the ones that are off screen or expired
+                    self.shooting_stars.update()
+
+            with profiler.section("entities"):
+                # Remove objects the camera has passed
+                self.cull_behind(self.platforms, self.platform_grid)
+                self.cull_behind(self.spikes, self.spike_grid)
+                self.cull_behind(self.monsters)
+                self.cull_behind(self.powerups, self.powerup_grid)
+                self.cull_behind(self.spaceships, self.spaceship_grid)
+
+            with profiler.section("collision"):
+                # The player can still dash this frame, so look that far to either side
+                left = self.camera_x + self.player.x - self.player.dash_speed
+                right = self.camera_x + self.player.x + self.player.width + self.player.dash_speed
+                powerups = self.powerup_grid.query(left, right)
+                self.player.update(self.platform_grid.query(left, right), self.spike_grid.query(left, right),
+                                   self.projectiles, powerups, self.camera_x)
+                for powerup in powerups:
+                    if powerup.collected:
+                        self.despawn(self.powerups, self.powerup_grid, powerup)
+            with profiler.section("generation"):
+                self.pull_level()
             
             # Update score
             self.score += 1
@@ -1046,247 +2379,605 @@ class Game:
                     self.tutorial_step += 1
                     self.tutorial_timer = 0
 
-            # Update particle system
-            self.particle_system = [(x, y, size, life - 1, color) for x, y, size, life, color in self.particle_system if life > 0]
-            
-            # Add new background particles
-            if len(self.background_particles) < self.max_background_particles:
-                self.background_particles.append((
-                    random.randint(0, WIDTH),
-                    random.randint(0, HEIGHT),
-                    random.randint(1, 3),
-                    random.randint(30, 60),
-                    (random.randint(100, 255), random.randint(100, 255), random.randint(100, 255))
-                ))
-
-            # Update background particles
-            self.background_particles = [(x, y, size, life - 1, color) for x, y, size, life, color in self.background_particles if life > 0]
-
-            # Update spaceships
-            for spaceship in self.spaceships:
-                spaceship.update()
-                if spaceship.is_active and spaceship.travel_progress >= spaceship.travel_distance:
-                    self.spaceships.remove(spaceship)
-                elif spaceship.x + spaceship.width < 0:
+            if self.effects:
+                with profiler.section("fx"):
+                    # Update particle system
+                    self.particle_system.update()
+                
+                    # Add new background particles
+                    rng = self.background_particles.rng
+                    self.background_particles.emit(1, rng.integers(0, WIDTH + 1), rng.integers(0, HEIGHT + 1),
+                                                   rng.integers(30, 61), size=rng.integers(1, 4),
+                                                   color=rng.integers(0, len(self.background_particles.palette)),
+                                                   fade=60)
+
+                    # Update background particles
+                    self.background_particles.update()
+
+            with profiler.section("entities"):
+                # Update spaceships, a boarded one is gone once it has flown its distance
+                landed = []
+                for spaceship in self.spaceships:
+                    if not spaceship.is_active:
+                        spaceship.update()
+                        continue
+                    self.spaceship_grid.remove(spaceship, spaceship.x, spaceship.x + spaceship.width)
+                    spaceship.update()
+                    if spaceship.travel_progress >= spaceship.travel_distance:
+                        landed.append(spaceship)
+                    else:
+                        self.spaceship_grid.insert(spaceship, spaceship.x, spaceship.x + spaceship.width)
+                for spaceship in landed:
                     self.spaceships.remove(spaceship)
 
-    def draw(self, surface):
+    def update_spike_glow(self):
+        self.spike_glow_radius += 0.2 * self.spike_glow_direction
+        if self.spike_glow_radius > 5 or self.spike_glow_radius < 0:
+            self.spike_glow_direction *= -1
+
+    def view_x(self, alpha=1.0):
+        # Camera position alpha of the way from the previous tick to this one, whole pixels
+        return int(self.previous_camera_x + (self.camera_x - self.previous_camera_x) * alpha)
+
+    def draw(self, surface, alpha=1.0):
+        # Returns the list of rects to push with pygame.display.update, or None when
+        # the whole frame was redrawn and should be flipped. alpha is how far the frame
+        # is between the previous tick and the latest one.
+        if self.background is None:
+            with startup.phase("background"):
+                self.generate_background()
+
         # Apply screen shake
-        shake_offset = (random.randint(-self.screen_shake, self.screen_shake),
-                       random.randint(-self.screen_shake, self.screen_shake)) if self.screen_shake > 0 else (0, 0)
-        
-        # Create a temporary surface for all game elements
-        game_surface = pygame.Surface((WIDTH, HEIGHT))
-        game_surface.blit(self.background, (0, 0))
-        
-        # Draw all game elements on the temporary surface
+        shake_offset = (self.fx_rng.randint(-self.screen_shake, self.screen_shake),
+                       self.fx_rng.randint(-self.screen_shake, self.screen_shake)) if self.screen_shake > 0 else (0, 0)
+
+        if not self.use_dirty_rects:
+            self.draw_frame(surface, shake_offset, alpha)
+            return None
+
+        rects = self.collect_dirty_rects(surface.get_rect(), alpha)
+        previous_rects = self.previous_rects
+        # Shaken and paused frames cover the whole screen, so the frame after them must too
+        if self.screen_shake > 0 or self.is_paused:
+            self.previous_rects = None
+        else:
+            self.previous_rects = rects
+
+        if (previous_rects is None or self.screen_shake > 0 or self.is_paused or
+                len(previous_rects) + len(rects) > DIRTY_RECT_LIMIT):
+            self.draw_frame(surface, shake_offset, alpha)
+            return None
+
+        # Erase last frame's objects and clear under this frame's, then redraw on top
+        dirty_rects = previous_rects + rects
+        with profiler.section("background"):
+            for rect in dirty_rects:
+                surface.blit(self.background, rect, rect)
+        profiler.count_blits(len(dirty_rects))
+        self.draw_scene(surface, shake_offset, alpha)
+        return dirty_rects
+
+    def draw_frame(self, surface, shake_offset, alpha=1.0):
+        # Draw straight into the target surface, which is already the display's back buffer
+        with profiler.section("background"):
+            surface.blit(self.background, (0, 0))
+        profiler.count_blits()
+        self.draw_scene(surface, shake_offset, alpha)
+
+        # Apply the shake offset while presenting
+        with profiler.section("shake"):
+            self.present_shake(surface, shake_offset)
+
+    def draw_scene(self, surface, shake_offset, alpha=1.0):
+        # Every game element is queued by layer and blitted in one batch per layer
+        queue = self.render_queue
+        camera_x = self.view_x(alpha)
+        for name in WORLD_LAYERS:
+            queue.layer(name).offset = (camera_x, 0)
+
         # Draw background particles
-        for x, y, life in self.particles:
-            alpha = int(255 * (life / 60))
-            particle_color = (255, 255, 255, alpha)
-            particle_surface = pygame.Surface((3, 3), pygame.SRCALPHA)
-            pygame.draw.circle(particle_surface, particle_color, (1, 1), 1)
-            game_surface.blit(particle_surface, (int(x) - shake_offset[0], int(y) - shake_offset[1]))
+        with profiler.section("particles"):
+            self.particles.draw(queue.layer("particles"), offset=(-shake_offset[0], -shake_offset[1]), alpha=alpha)
         
         # Draw shooting stars
-        for star in self.shooting_stars:
-            star.draw(game_surface)
+        with profiler.section("shooting_stars"):
+            self.shooting_stars.draw(queue.layer("shooting_stars"), alpha)
         
         # Draw meteorites
-        for meteorite in self.meteorites:
-            meteorite.draw(game_surface)
+        with profiler.section("meteorites"):
+            self.meteorites.draw(queue.layer("meteorites"), alpha)
         
         # Draw platforms
-        for platform in self.platforms:
-            platform.draw(game_surface)
+        with profiler.section("platforms"):
+            layer = queue.layer("platforms")
+            for platform in self.platforms:
+                platform.draw(layer)
         
         # Draw spikes
-        for spike in self.spikes:
-            spike.draw(game_surface)
+        with profiler.section("spikes"):
+            layer = queue.layer("spikes")
+            for spike in self.spikes:
+                spike.draw(layer, self.spike_glow_radius)
         
         # Draw monsters
-        for monster in self.monsters:
-            monster.draw(game_surface)
+        with profiler.section("monsters"):
+            layer = queue.layer("monsters")
+            for monster in self.monsters:
+                monster.draw(layer)
+
+        # Draw monster projectiles
+        with profiler.section("projectiles"):
+            self.projectiles.draw(queue.layer("projectiles"), camera_x, alpha)
 
         # Draw powerups
-        for powerup in self.powerups:
-            powerup.draw(game_surface)
+        with profiler.section("powerups"):
+            layer = queue.layer("powerups")
+            for powerup in self.powerups:
+                powerup.draw(layer)
         
         # Draw player
-        self.player.draw(game_surface)
-        
+        with profiler.section("player"):
+            self.player.draw(queue.layer("player"), self.fx_rng, self.ticks(), alpha)
+
+        with profiler.section("hud"):
+            self.draw_hud(queue.layer("hud"))
+
+        # Draw particle system
+        with profiler.section("effects"):
+            self.particle_system.draw(queue.layer("effects"), alpha=alpha)
+
+        # Draw background particles
+        with profiler.section("background_particles"):
+            self.background_particles.draw(queue.layer("background_particles"), alpha=alpha)
+
+        # Draw spaceships
+        with profiler.section("spaceships"):
+            layer = queue.layer("spaceships")
+            for spaceship in self.spaceships:
+                spaceship.draw(layer, alpha)
+
+        queue.flush(surface)
+
+    def draw_hud(self, hud):
         # Draw score with enhanced glow effect
-        font = pygame.font.Font(None, 36)
-        score_text = font.render(f"Score: {self.score}", True, WHITE)
-        score_rect = score_text.get_rect(topleft=(10, 10))
-        
-        # Add multiple layers of glow
-        for i in range(3, 0, -1):
-            glow_surface = pygame.Surface((score_rect.width + i*4, score_rect.height + i*4), pygame.SRCALPHA)
-            glow_surface.blit(score_text, (i*2, i*2))
-            game_surface.blit(glow_surface, (10 - i*2, 10 - i*2))
-        game_surface.blit(score_text, (10, 10))
+        score_digits.draw(hud, "Score: ", self.score, (10, 10))
 
         # Draw powerup timer if active
         if self.player.has_jump_powerup:
             powerup_time = self.player.powerup_timer // 60  # Convert frames to seconds
-            powerup_text = font.render(f"Jump Boost: {powerup_time}s", True, CYAN)
-            powerup_rect = powerup_text.get_rect(topleft=(10, 50))
-            
-            # Add glow to powerup timer
-            for i in range(3, 0, -1):
-                glow_surface = pygame.Surface((powerup_rect.width + i*4, powerup_rect.height + i*4), pygame.SRCALPHA)
-                glow_surface.blit(powerup_text, (i*2, i*2))
-                game_surface.blit(glow_surface, (10 - i*2, 50 - i*2))
-            game_surface.blit(powerup_text, (10, 50))
+            powerup_text = text_cache.render(f"Jump Boost: {powerup_time}s", 36, CYAN, glow=3)
+            hud.blit(powerup_text, (10, 50))
 
         # Draw game over message with enhanced animation
         if not self.player.is_alive:
-            game_over_font = pygame.font.Font(None, 72)
-            game_over_text = game_over_font.render("GAME OVER", True, RED)
+            game_over_text = text_cache.render("GAME OVER", 72, RED, glow=5)
             game_over_rect = game_over_text.get_rect(center=(WIDTH//2, HEIGHT//2 - 36))
-            
-            # Add multiple layers of glow to game over text
-            for i in range(5, 0, -1):
-                glow_surface = pygame.Surface((game_over_rect.width + i*4, game_over_rect.height + i*4), pygame.SRCALPHA)
-                glow_surface.blit(game_over_text, (i*2, i*2))
-                game_surface.blit(glow_surface, (game_over_rect.x - i*2, game_over_rect.y - i*2))
-            game_surface.blit(game_over_text, game_over_rect)
-
-            restart_font = pygame.font.Font(None, 36)
-            restart_text = restart_font.render("Press R to restart", True, WHITE)
+            hud.blit(game_over_text, game_over_rect)
+
+            restart_text = text_cache.render("Press R to restart", 36, WHITE)
             restart_rect = restart_text.get_rect(center=(WIDTH//2, HEIGHT//2 + 36))
-            game_surface.blit(restart_text, restart_rect)
+            hud.blit(restart_text, restart_rect)
 
         # Draw tutorial message with fade out
         if self.tutorial_step < len(self.tutorial_messages):
             # Calculate alpha based on time remaining
             alpha = min(255, max(0, 255 - (self.tutorial_timer - 240) * 2))  # Fade out in last second
-            font = pygame.font.Font(None, 36)
-            tutorial_text = font.render(self.tutorial_messages[self.tutorial_step], True, WHITE)
+            tutorial_text = text_cache.render(self.tutorial_messages[self.tutorial_step], 36, WHITE, alpha=alpha)
             tutorial_rect = tutorial_text.get_rect(center=(WIDTH//2, HEIGHT - 50))
-            
-            # Create a surface with alpha
-            tutorial_surface = pygame.Surface((tutorial_rect.width, tutorial_rect.height), pygame.SRCALPHA)
-            tutorial_surface.blit(tutorial_text, (0, 0))
-            tutorial_surface.set_alpha(alpha)
-            
-            game_surface.blit(tutorial_surface, tutorial_rect)
+            hud.blit(tutorial_text, tutorial_rect)
 
         # Draw pause menu
         if self.is_paused:
-            overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-            overlay.fill((0, 0, 0, 128))
-            game_surface.blit(overlay, (0, 0))
+            overlay = sprite_cache.rect(WIDTH, HEIGHT, BLACK, 128)
+            hud.blit(overlay, (0, 0))
             
-            font = pygame.font.Font(None, 72)
-            pause_text = font.render("PAUSED", True, WHITE)
+            pause_text = text_cache.render("PAUSED", 72, WHITE)
             pause_rect = pause_text.get_rect(center=(WIDTH//2, HEIGHT//2 - 50))
-            game_surface.blit(pause_text, pause_rect)
+            hud.blit(pause_text, pause_rect)
             
-            font = pygame.font.Font(None, 36)
-            resume_text = font.render("Press P to resume", True, WHITE)
+            resume_text = text_cache.render("Press P to resume", 36, WHITE)
             resume_rect = resume_text.get_rect(center=(WIDTH//2, HEIGHT//2 + 50))
-            game_surface.blit(resume_text, resume_rect)
-
-        # Draw particle system
-        for x, y, size, life, color in self.particle_system:
-            alpha = int(255 * (life / 30))
-            particle_color = (*color, alpha)
-            particle_surface = pygame.Surface((size * 2, size * 2), pygame.SRCALPHA)
-            pygame.draw.circle(particle_surface, particle_color, (size, size), size)
-            game_surface.blit(particle_surface, (int(x), int(y)))
-
-        # Draw background particles
-        for x, y, size, life, color in self.background_particles:
-            alpha = int(255 * (life / 60))
-            particle_color = (*color, alpha)
-            particle_surface = pygame.Surface((size * 2, size * 2), pygame.SRCALPHA)
-            pygame.draw.circle(particle_surface, particle_color, (size, size), size)
-            game_surface.blit(particle_surface, (int(x), int(y)))
-
-        # Draw spaceships
+            hud.blit(resume_text, resume_rect)
+
+    def collect_dirty_rects(self, screen_rect, alpha=1.0):
+        camera_x = self.view_x(alpha)
+        rects = self.particles.rects(alpha)
+        rects.extend(self.shooting_stars.rects(alpha))
+        rects.extend(self.meteorites.rects(alpha))
+        # World objects report world rects, shift them onto the screen
+        for group in (self.platforms, self.spikes, self.monsters, self.powerups):
+            for entity in group:
+                rects.extend(rect.move(-camera_x, 0) for rect in entity.dirty_rects())
         for spaceship in self.spaceships:
-            spaceship.draw(game_surface)
+            rects.extend(rect.move(-camera_x, 0) for rect in spaceship.dirty_rects(alpha))
+        rects.extend(self.projectiles.rects(camera_x, alpha))
+        rects.extend(self.player.dirty_rects(alpha))
+        rects.extend(self.particle_system.rects(alpha))
+        rects.extend(self.background_particles.rects(alpha))
+        rects.extend(self.hud_rects())
+
+        # Keep only the on-screen part of each rect
+        return [rect.clip(screen_rect) for rect in rects if rect.colliderect(screen_rect)]
+
+    def hud_rects(self):
+        rects = [score_digits.measure("Score: ", self.score, (10, 10))]
+        if self.player.has_jump_powerup:
+            powerup_time = self.player.powerup_timer // 60
+            rects.append(text_cache.render(f"Jump Boost: {powerup_time}s", 36, CYAN, glow=3).get_rect(topleft=(10, 50)))
+        if not self.player.is_alive:
+            rects.append(text_cache.render("GAME OVER", 72, RED, glow=5).get_rect(center=(WIDTH//2, HEIGHT//2 - 36)))
+            rects.append(text_cache.render("Press R to restart", 36, WHITE).get_rect(center=(WIDTH//2, HEIGHT//2 + 36)))
+        if self.tutorial_step < len(self.tutorial_messages):
+            tutorial_text = text_cache.render(self.tutorial_messages[self.tutorial_step], 36, WHITE)
+            rects.append(tutorial_text.get_rect(center=(WIDTH//2, HEIGHT - 50)))
+        return rects
 
-        # Blit the game surface to the main surface with shake offset
-        surface.blit(game_surface, shake_offset)
+    def present_shake(self, surface, offset):
+        dx, dy = offset
+        if dx == 0 and dy == 0:
+            return
+        # Shift the finished frame in place and clear only the strips it uncovered
+        surface.scroll(dx, dy)
+        width, height = surface.get_size()
+        if dx > 0:
+            surface.fill(BLACK, (0, 0, dx, height))
+        elif dx < 0:
+            surface.fill(BLACK, (width + dx, 0, -dx, height))
+        if dy > 0:
+            surface.fill(BLACK, (0, 0, width, dy))
+        elif dy < 0:
+            surface.fill(BLACK, (0, height + dy, width, -dy))
+
+    def step(self, held, pressed):
+        # Run one tick from input bits: held keys (LEFT/RIGHT) and keys pressed since the last tick
+        for key, bit in INPUT_KEYS:
+            if pressed & bit:
+                self.handle_key(key)
+        if not self.is_paused and self.player.is_alive:
+            if held & INPUT_LEFT:
+                self.player.move_left()
+            elif held & INPUT_RIGHT:
+                self.player.move_right()
+            else:
+                self.player.stop_moving()
+        self.update()
 
     def handle_event(self, event):
         if event.type == pygame.KEYDOWN:
-            if event.key == pygame.K_p:
-                self.is_paused = not self.is_paused
+            self.handle_key(event.key)
+
+    def handle_key(self, key):
+        if key == pygame.K_p:
+            self.is_paused = not self.is_paused
+            if self.audio_enabled:
                 if self.is_paused:
-                    pygame.mixer.music.pause()
-                else:
-                    pygame.mixer.music.unpause()
-            elif event.key == pygame.K_LSHIFT and not self.is_paused:
-                self.player.dash()
-                # Add screen shake for dash
-                self.screen_shake = 5
-            elif event.key == pygame.K_SPACE and not self.is_paused:
-                # Check for spaceship interaction
-                for spaceship in self.spaceships:
-                    if (not spaceship.is_active and 
-                        self.player.x < spaceship.x + spaceship.width and
-                        self.player.x + self.player.width > spaceship.x and
-                        self.player.y < spaceship.y + spaceship.height and
-                        self.player.y + self.player.height > spaceship.y):
-                        spaceship.is_active = True
-                        self.player.x = spaceship.x + spaceship.width//2
-                        self.player.y = spaceship.y + spaceship.height//2
-                        self.player.vel_y = 0
-                        self.player.is_jumping = False
-                        self.player.can_double_jump = True
-                        break
+                    soundtrack.pause()
                 else:
-                    self.player.jump()
-            elif event.key == pygame.K_r and not self.player.is_alive:
-                self.restart()
-                self.start_music()  # Restart music when game restarts
+                    soundtrack.unpause()
+        elif key == pygame.K_LSHIFT and not self.is_paused:
+            self.player.dash()
+            # Add screen shake for dash
+            self.screen_shake = 5
+        elif key == pygame.K_SPACE and not self.is_paused:
+            # Check for spaceship interaction
+            player_x = self.camera_x + self.player.x  # Spaceships are in world space
+            for spaceship in self.spaceship_grid.query(player_x, player_x + self.player.width):
+                if (not spaceship.is_active and 
+                    player_x < spaceship.x + spaceship.width and
+                    player_x + self.player.width > spaceship.x and
+                    self.player.y < spaceship.y + spaceship.height and
+                    self.player.y + self.player.height > spaceship.y):
+                    spaceship.is_active = True
+                    self.player.x = spaceship.x - self.camera_x + spaceship.width//2
+                    self.player.y = spaceship.y + spaceship.height//2
+                    self.player.vel_y = 0
+                    self.player.is_jumping = False
+                    self.player.can_double_jump = True
+                    break
+            else:
+                self.player.jump()
+        elif key == pygame.K_r and not self.player.is_alive:
+            self.restart()
+            self.start_music()  # Restart music when game restarts
+
+    def close(self):
+        # Stops the level worker and the music. Games that are thrown away should be closed.
+        if self.level is not None:
+            self.level.stop()
+        self.stop_music()
 
     def restart(self):
-        self.player = Player()
+        self.camera_x = 0
+        self.previous_camera_x = 0
+        for grid in (self.platform_grid, self.spike_grid, self.powerup_grid, self.spaceship_grid):
+            grid.clear()
+        self.projectiles.clear()
+        self.player = Player(self.np_rng, self.effects)
         self.platforms = []
         self.spikes = []
         self.monsters = []
         self.powerups = []
         self.score = 0
         self.game_over = False
-        self.generate_initial_platforms()
         self.spaceships = []
-        self.last_spaceship_time = 0
+        self.start_level()
         self.start_music()  # Start music when game restarts
 
-def main():
-    game = Game()
+# One throwaway instance of each entity kind, used to measure what an instance costs
+ENTITY_SAMPLES = {
+    "Platform": lambda: Platform(0, 0, 150, 30),
+    "Spike": lambda: Spike(0, 0),
+    "Powerup": lambda: Powerup(0, 0),
+    "Monster": lambda: Monster(0, 0),
+}
+
+def live_entities(game):
+    return {
+        "Platform": game.platforms,
+        "Spike": game.spikes,
+        "Powerup": game.powerups,
+        "Monster": game.monsters,
+    }
+
+def instance_size(entity):
+    size = sys.getsizeof(entity)
+    if hasattr(entity, "__dict__"):
+        size += sys.getsizeof(entity.__dict__)
+    return size
+
+def entity_memory_report(game, samples=1000):
+    # Per kind: live count, sys.getsizeof of the live objects (plus their __dict__ if
+    # they have one) and the bytes tracemalloc sees per freshly built instance
+    # Pooled kinds cost their arrays divided by their capacity
+    rows = []
+    for kind, pool in (("Projectile", game.projectiles), ("Meteorite", game.meteorites),
+                       ("ShootingStar", game.shooting_stars)):
+        pool_bytes = sum(array.nbytes for array in pool.arrays)
+        rows.append((kind, len(pool), pool_bytes, pool_bytes / pool.capacity))
+    live = live_entities(game)
+    for kind, build in ENTITY_SAMPLES.items():
+        entities = live[kind]
+        shallow = sum(instance_size(entity) for entity in entities)
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        batch = [build() for _ in range(samples)]
+        per_instance = (tracemalloc.get_traced_memory()[0] - before) / samples
+        tracemalloc.stop()
+        del batch
+        rows.append((kind, len(entities), shallow, per_instance))
+    return rows
+
+def print_memory_report(rows):
+    print(f"{'kind':<14}{'live':>6}{'getsizeof':>12}{'traced/obj':>12}")
+    for kind, count, shallow, per_instance in rows:
+        print(f"{kind:<14}{count:>6}{shallow:>12}{per_instance:>12.1f}")
+    print(f"{'cache':<14}{'entries':>8}{'hits':>8}{'misses':>8}{'evicted':>8}{'hit rate':>10}{'KiB':>8}")
+    for name, cache in (("sprites", sprite_cache), ("platforms", platform_textures)):
+        stats = cache.stats()
+        print(f"{name:<14}{stats['entries']:>8}{stats['hits']:>8}{stats['misses']:>8}{stats['evictions']:>8}"
+              f"{stats['hit_rate']:>10.1%}{stats['memory_bytes'] // 1024:>8}")
+
+class InputRecorder:
+    # Writes the seed, then one record per tick on which the held keys changed or a key
+    # was pressed. Ticks with the same input as the last record cost nothing.
+    def __init__(self, path, seed, fx_density=FX_DENSITY):
+        self.file = open(path, "wb")
+        self.file.write(REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, seed, TICK_RATE, fx_density))
+        self.tick = 0
+        self.held = 0
+
+    def record(self, held, pressed):
+        if held != self.held or pressed:
+            self.file.write(REPLAY_RECORD.pack(self.tick, held, pressed))
+            self.held = held
+        self.tick += 1
+
+    def close(self):
+        # The closing record marks how many ticks the run lasted
+        self.file.write(REPLAY_RECORD.pack(self.tick, self.held, 0))
+        self.file.close()
+
+class InputReplay:
+    # Plays back a file written by InputRecorder, one tick of input bits at a time
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, self.seed, tick_rate, self.fx_density = REPLAY_HEADER.unpack_from(data)
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+            raise ValueError(f"{path} is not a Run 3 replay")
+        if tick_rate != TICK_RATE:
+            raise ValueError(f"{path} was recorded at {tick_rate} ticks per second, the game runs at {TICK_RATE}")
+        self.records = list(REPLAY_RECORD.iter_unpack(data[REPLAY_HEADER.size:]))
+        self.length = self.records[-1][0] if self.records else 0
+        self.index = 0
+        self.tick = 0
+        self.held = 0
+
+    def finished(self):
+        return self.tick >= self.length
+
+    def next(self):
+        # (held, pressed) for the next tick
+        pressed = 0
+        if self.index < len(self.records) and self.records[self.index][0] == self.tick:
+            _, self.held, pressed = self.records[self.index]
+            self.index += 1
+        self.tick += 1
+        return self.held, pressed
+
+def main(dirty_rects=DIRTY_RECT_RENDERING, seed=None, record=None, replay=None, fx_density=FX_DENSITY,
+         level_thread=LEVEL_THREAD, startup_report=False, profile_csv=None):
+    # record is a path to write this session's inputs to, replay an InputReplay to play back,
+    # profile_csv a path to write per-frame timings to on exit. F3 toggles the profiler overlay.
+    screen = init(headless=False)
+    clock = pygame.time.Clock()
+    if profile_csv:
+        profiler.record()
+    if replay is not None:
+        game = Game(headless=False, seed=replay.seed, fx_density=replay.fx_density, level_thread=level_thread)
+    else:
+        game = Game(headless=False, seed=seed, fx_density=fx_density, level_thread=level_thread)
+    game.use_dirty_rects = dirty_rects
+    recorder = InputRecorder(record, game.seed, game.fx_density) if record else None
+    pressed = 0  # Keys pressed since the last tick
     running = True
 
-    while running:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-            game.handle_event(event)
-
-        if not game.is_paused:
-            # Get keyboard input
-            keys = pygame.key.get_pressed()
-            if game.player.is_alive:
-                if keys[pygame.K_LEFT]:
-                    game.player.move_left()
-                elif keys[pygame.K_RIGHT]:
-                    game.player.move_right()
-                else:
-                    game.player.stop_moving()
+    # Fixed timestep: the simulation runs TICK_RATE ticks per second of real time,
+    # however many frames that takes to draw
+    tick_length = 1 / TICK_RATE
+    accumulator = 0.0
+    previous_time = time.perf_counter()
 
-        # Update and draw
-        game.update()
-        screen.fill(BLACK)
-        game.draw(screen)
-        pygame.display.flip()
+    while running:
+        now = time.perf_counter()
+        accumulator += now - previous_time
+        previous_time = now
+
+        profiler.begin_frame()
+        # Key presses are applied at the start of the next tick so a recording sees them
+        # exactly where the game did
+        with profiler.section("events"):
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    running = False
+                elif event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_F3:
+                        profiler.toggle_overlay()
+                    for key, bit in INPUT_KEYS:
+                        if event.key == key:
+                            pressed |= bit
+
+        ticks = 0
+        while accumulator >= tick_length and ticks < MAX_CATCH_UP_TICKS:
+            if replay is not None:
+                if replay.finished():
+                    running = False
+                    break
+                held, tick_pressed = replay.next()
+            else:
+                # Get keyboard input
+                keys = pygame.key.get_pressed()
+                held = (INPUT_LEFT if keys[pygame.K_LEFT] else 0) | (INPUT_RIGHT if keys[pygame.K_RIGHT] else 0)
+                tick_pressed = pressed
+            pressed = 0
+            if recorder is not None:
+                recorder.record(held, tick_pressed)
+
+            game.step(held, tick_pressed)
+            accumulator -= tick_length
+            ticks += 1
+        if ticks == MAX_CATCH_UP_TICKS:
+            # Too far behind to catch up, drop the backlog rather than falling further behind
+            accumulator = min(accumulator, tick_length)
+
+        # Draw, interpolating between the last two ticks
+        dirty_rects = game.draw(screen, accumulator / tick_length)
+        if profiler.overlay:
+            with profiler.section("overlay"):
+                profiler.draw(screen)
+            # The overlay isn't in the dirty rects, so redraw everything under it
+            dirty_rects = None
+            game.previous_rects = None
+        with profiler.section("present"):
+            if dirty_rects is None:
+                pygame.display.flip()
+            else:
+                pygame.display.update(dirty_rects)
+        profiler.end_frame()
+        startup.frame_shown()
+        soundtrack.update()
+        if startup_report and soundtrack.ready.is_set():
+            startup.print()
+            startup_report = False
         clock.tick(FPS)
 
+    game.close()
+    if recorder is not None:
+        recorder.close()
+    if profile_csv:
+        profiler.write_csv(profile_csv)
+        profiler.print_summary()
     pygame.quit()
 
+def run_headless(frames, draw=False, dirty_rects=False, memory_report=False, seed=None, record=None, replay=None,
+                 fx_density=FX_DENSITY, level_thread=LEVEL_THREAD, startup_report=False, profile_csv=None):
+    # Step the game as fast as the CPU allows. Without a replay nobody is at the keys,
+    # so R is pressed whenever the player dies.
+    init(headless=True)
+    if profile_csv:
+        profiler.record()
+    if replay is not None:
+        game = Game(headless=True, seed=replay.seed, fx_density=replay.fx_density, level_thread=level_thread)
+    else:
+        game = Game(headless=True, seed=seed, fx_density=fx_density, level_thread=level_thread)
+    game.use_dirty_rects = dirty_rects
+    recorder = InputRecorder(record, game.seed, game.fx_density) if record else None
+    if replay is not None:
+        frames = replay.length
+    target = pygame.Surface((WIDTH, HEIGHT)) if draw else None
+    runs = 1
+    best = 0
+    start = time.perf_counter()
+    for _ in range(frames):
+        if replay is not None:
+            held, pressed = replay.next()
+        else:
+            held, pressed = 0, 0 if game.player.is_alive else INPUT_R
+        if pressed & INPUT_R and not game.player.is_alive:
+            best = max(best, game.score)
+            runs += 1
+        if recorder is not None:
+            recorder.record(held, pressed)
+        profiler.begin_frame()
+        game.step(held, pressed)
+        if target is not None:
+            game.draw(target)
+        profiler.end_frame()
+        startup.frame_shown()
+    elapsed = time.perf_counter() - start
+    game.close()
+    if recorder is not None:
+        recorder.close()
+    best = max(best, game.score)
+    fps = frames / elapsed if elapsed > 0 else float("inf")
+    print(f"{frames} frames in {elapsed:.2f}s ({fps:.0f} fps), {runs} runs, best score {best}")
+    print(f"seed {game.seed}: tick {game.frame}, score {game.score}, camera {game.camera_x}, "
+          f"player ({game.player.x:.2f}, {game.player.y:.2f})")
+    if memory_report:
+        print_memory_report(entity_memory_report(game))
+    if startup_report:
+        startup.print()
+    if profile_csv:
+        profiler.write_csv(profile_csv)
+        profiler.print_summary()
+
+startup.add("import", time.perf_counter() - IMPORT_STARTED)
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run 3")
+    parser.add_argument("--headless", action="store_true", help="run without a window or audio")
+    parser.add_argument("--frames", type=int, default=3600, help="frames to simulate in headless mode")
+    parser.add_argument("--draw", action="store_true", help="render headless frames to an off-screen surface")
+    parser.add_argument("--dirty-rects", action="store_true", help="only redraw the parts of the screen that changed")
+    parser.add_argument("--memory-report", action="store_true", help="print per-entity memory use after a headless run")
+    parser.add_argument("--seed", type=int, help="seed for the level and every other random roll")
+    parser.add_argument("--fx-density", type=float, default=FX_DENSITY,
+                        help="meteorites and shooting stars per spawn, e.g. 8 for a meteor shower")
+    parser.add_argument("--record", metavar="FILE", help="save the seed and inputs to a replay file")
+    parser.add_argument("--replay", metavar="FILE", help="play back a replay file instead of reading the keyboard")
+    parser.add_argument("--no-level-thread", action="store_false", dest="level_thread",
+                        help="generate the level on the game thread instead of a worker")
+    parser.add_argument("--startup-report", action="store_true", help="print how long each startup phase took")
+    parser.add_argument("--profile-csv", metavar="FILE", help="write per-frame section timings to a CSV file on exit")
+    args = parser.parse_args()
+    replay = InputReplay(args.replay) if args.replay else None
+    # Headless runs have no window, audio or wall clock
+    if args.headless or os.environ.get("RUN3_HEADLESS") == "1":
+        run_headless(args.frames, draw=args.draw, dirty_rects=args.dirty_rects, memory_report=args.memory_report,
+                     seed=args.seed, record=args.record, replay=replay, fx_density=args.fx_density,
+                     level_thread=args.level_thread, startup_report=args.startup_report,
+                     profile_csv=args.profile_csv)
+    else:
+        main(dirty_rects=args.dirty_rects or DIRTY_RECT_RENDERING, seed=args.seed, record=args.record, replay=replay,
+             fx_density=args.fx_density, level_thread=args.level_thread, startup_report=args.startup_report,
+             profile_csv=args.profile_csv) 
\ No newline at end of file
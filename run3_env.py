@@ -0,0 +1,306 @@
+# Reinforcement learning environments for run3.py. Run3Env wraps one Game behind the usual
+# reset/step interface with five discrete actions, and VectorEnv steps many of them per call,
+# in this process or spread over worker processes that share their buffers with it.
+#
+#   env = Run3Env(seed=0)
+#   observation, info = env.reset()
+#   observation, reward, terminated, truncated, info = env.step(JUMP)
+#
+#   with VectorEnv(64, seed=0, workers=4) as envs:
+#       observations, info = envs.reset()
+#       observations, rewards, terminated, truncated, info = envs.step(actions)
+import os
+import random
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+import run3
+
+# Actions, each a (held, pressed) pair of input bits as Game.step takes them
+NONE, LEFT, RIGHT, JUMP, DASH = range(5)
+ACTIONS = ("none", "left", "right", "jump", "dash")
+ACTION_INPUTS = ((0, 0), (run3.INPUT_LEFT, 0), (run3.INPUT_RIGHT, 0), (0, run3.INPUT_SPACE), (0, run3.INPUT_LSHIFT))
+
+SCORE_REWARD = 0.01  # Per point scored, and the game scores a point for every tick survived
+DEATH_REWARD = -1.0
+ENV_MAX_TICKS = 5 * 60 * run3.TICK_RATE  # Episodes still going after five minutes are truncated
+
+# The observation is one float32 vector. Positions are relative to the player's centre, in
+# screen widths across and screen heights down. The nearest few of each kind ahead of the
+# player fill fixed slots, each starting with 1 if the slot is in use and 0 if it is empty.
+PLAYER_FEATURES = 8  # x, y, vel_y, jumping, wall running, dashing, dash cooldown, jump powerup
+OBS_SLOTS = (
+    ("platform", 4, 4),  # Slots and features per slot: used, left edge, right edge, top
+    ("spike", 3, 3),  # used, x, y
+    ("monster", 3, 4),  # used, x, y, time to its next shot
+    ("projectile", 4, 5),  # used, x, y, vx, vy
+    ("powerup", 2, 3),  # used, x, y
+)
+OBS_SIZE = PLAYER_FEATURES + sum(slots * features for _, slots, features in OBS_SLOTS)
+OBS_AHEAD = run3.WIDTH  # How far ahead of the player entities are looked for
+
+def in_view(entities, behind, ahead, slots):
+    # The first slots entities overlapping behind..ahead. The game keeps each list in x order
+    # and culls what the camera has passed, so this stops after a few of them.
+    found = []
+    for entity in entities:
+        if entity.x > ahead or len(found) == slots:
+            break
+        if entity.x + entity.width > behind:
+            found.append(entity)
+    return found
+
+def observe(game, out):
+    # Writes the observation of game into out, a float32 array of OBS_SIZE
+    player = game.player
+    center_x = game.camera_x + player.x + player.width / 2
+    center_y = player.y + player.height / 2
+    behind = center_x - player.width
+    ahead = center_x + OBS_AHEAD
+    # Built as one list and copied in with a single assignment, which is much cheaper
+    # than filling the array piece by piece
+    values = [player.x / run3.WIDTH, player.y / run3.HEIGHT, player.vel_y / -run3.JUMP_FORCE,
+              player.is_jumping, player.is_wall_running, player.is_dashing,
+              player.dash_cooldown / run3.DASH_COOLDOWN, player.has_jump_powerup]
+    slots = {kind: count for kind, count, _ in OBS_SLOTS}
+
+    rows = {}
+    rows["platform"] = [(1, (platform.x - center_x) / run3.WIDTH, (platform.x + platform.width - center_x) / run3.WIDTH,
+                         (platform.y - center_y) / run3.HEIGHT)
+                        for platform in in_view(game.platforms, behind, ahead, slots["platform"])]
+    rows["spike"] = [(1, (spike.x + spike.width / 2 - center_x) / run3.WIDTH,
+                      (spike.y + spike.height / 2 - center_y) / run3.HEIGHT)
+                     for spike in in_view(game.spikes, behind, ahead, slots["spike"])]
+    # Monsters shoot from anywhere on screen, so the ones behind the player count too
+    rows["monster"] = [(1, (monster.x + monster.width / 2 - center_x) / run3.WIDTH,
+                        (monster.y + monster.height / 2 - center_y) / run3.HEIGHT,
+                        monster.shoot_cooldown / monster.shoot_delay)
+                       for monster in in_view(game.monsters, game.camera_x, ahead, slots["monster"])]
+    rows["powerup"] = [(1, (powerup.x + powerup.width / 2 - center_x) / run3.WIDTH,
+                        (powerup.y + powerup.height / 2 - center_y) / run3.HEIGHT)
+                       for powerup in in_view(game.powerups, behind, ahead, slots["powerup"])]
+
+    # Shots come from every side, so the nearest ones count whichever way they are
+    pool = game.projectiles
+    count = pool.count
+    rows["projectile"] = []
+    if count:
+        dx = (pool.x[:count] - center_x) / run3.WIDTH
+        dy = (pool.y[:count] - center_y) / run3.HEIGHT
+        nearest = np.argsort(np.hypot(dx, dy))[:slots["projectile"]]
+        rows["projectile"] = np.column_stack((np.ones(len(nearest)), dx[nearest], dy[nearest],
+                                              pool.vx[nearest] / pool.speed, pool.vy[nearest] / pool.speed)).tolist()
+
+    for kind, count, features in OBS_SLOTS:
+        for row in rows[kind]:
+            values.extend(row)
+        values.extend([0] * ((count - len(rows[kind])) * features))
+    out[:] = values
+    return out
+
+class Run3Env:
+    # One game. Episodes end when the player dies or after max_ticks. Each action is held
+    # for action_repeat ticks, with jumps and dashes pressed on the first one only.
+    # Observations are written into the same array every step, out if one is given.
+    action_count = len(ACTIONS)
+    observation_size = OBS_SIZE
+
+    def __init__(self, seed=None, max_ticks=ENV_MAX_TICKS, action_repeat=1, out=None):
+        self.seeds = random.Random(seed)  # Each episode's game seed comes from here
+        self.max_ticks = max_ticks
+        self.action_repeat = action_repeat
+        self.observation = out if out is not None else np.zeros(OBS_SIZE, np.float32)
+        self.game = None
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.seeds = random.Random(seed)
+        self.close()
+        # A fresh game per episode is cheap without effects, and keeps each episode's
+        # level down to its seed
+        self.game = run3.Game(headless=True, seed=self.seeds.randrange(2**32), level_thread=False,
+                              effects=False)
+        return observe(self.game, self.observation), {"seed": self.game.seed}
+
+    def step(self, action):
+        game = self.game
+        player = game.player
+        held, pressed = ACTION_INPUTS[action]
+        score = game.score
+        for _ in range(self.action_repeat):
+            game.step(held, pressed)
+            pressed = 0
+            if not player.is_alive or game.frame >= self.max_ticks:
+                break
+        terminated = not player.is_alive
+        truncated = not terminated and game.frame >= self.max_ticks
+        reward = (game.score - score) * SCORE_REWARD + (DEATH_REWARD if terminated else 0.0)
+        info = {"score": game.score}
+        if terminated:
+            info["death_cause"] = player.death_cause
+        return observe(game, self.observation), reward, terminated, truncated, info
+
+    def close(self):
+        if self.game is not None:
+            self.game.close()
+            self.game = None
+
+def vector_layout(num_envs):
+    # Name, type and shape of each array VectorEnv shares with its workers, widest type
+    # first so every array stays aligned
+    return (("scores", np.int64, (num_envs,)), ("final_scores", np.int64, (num_envs,)),
+            ("actions", np.int64, (num_envs,)), ("observations", np.float32, (num_envs, OBS_SIZE)),
+            ("rewards", np.float32, (num_envs,)), ("terminated", np.bool_, (num_envs,)),
+            ("truncated", np.bool_, (num_envs,)))
+
+def vector_buffer_size(num_envs):
+    return sum(np.dtype(dtype).itemsize * int(np.prod(shape)) for _, dtype, shape in vector_layout(num_envs))
+
+def vector_arrays(buffer, num_envs):
+    # Views of every shared array, one after another in buffer
+    arrays, offset = {}, 0
+    for name, dtype, shape in vector_layout(num_envs):
+        arrays[name] = np.ndarray(shape, dtype, buffer, offset)
+        offset += arrays[name].nbytes
+    return arrays
+
+class EnvGroup:
+    # Some of a VectorEnv's games, all in one process. Actions are read from and results
+    # written to the shared arrays, at each game's index. Finished games start over at
+    # once, and final_scores holds the score they ended on for that step, -1 otherwise.
+    def __init__(self, arrays, indices, seeds, options):
+        self.arrays = arrays
+        self.indices = list(indices)
+        self.envs = [Run3Env(seeds[index], out=arrays["observations"][index], **options) for index in self.indices]
+
+    def reset(self, seeds=None):
+        arrays = self.arrays
+        for index, env in zip(self.indices, self.envs):
+            env.reset(None if seeds is None else seeds[index])
+            arrays["scores"][index] = 0
+            arrays["final_scores"][index] = -1
+
+    def step(self):
+        arrays = self.arrays
+        actions = arrays["actions"].tolist()
+        rewards, scores, final_scores = arrays["rewards"], arrays["scores"], arrays["final_scores"]
+        terminated, truncated = arrays["terminated"], arrays["truncated"]
+        for index, env in zip(self.indices, self.envs):
+            _, reward, ended, cut_short, info = env.step(actions[index])
+            rewards[index] = reward
+            terminated[index] = ended
+            truncated[index] = cut_short
+            if ended or cut_short:
+                final_scores[index] = info["score"]
+                env.reset()
+            else:
+                final_scores[index] = -1
+            scores[index] = env.game.score
+
+    def close(self):
+        for env in self.envs:
+            env.close()
+
+def run_worker(connection, memory_name, num_envs, indices, seeds, options):
+    # A worker process's loop: run each command from VectorEnv on this worker's games
+    memory = shared_memory.SharedMemory(name=memory_name)
+    group = EnvGroup(vector_arrays(memory.buf, num_envs), indices, seeds, options)
+    try:
+        while True:
+            command, argument = connection.recv()
+            if command == "step":
+                group.step()
+            elif command == "reset":
+                group.reset(argument)
+            else:
+                break
+            connection.send(None)
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        group.close()
+        group = None  # The views have to go before the memory can be closed
+        memory.close()
+
+class VectorEnv:
+    # num_envs games stepped together. With workers, the games are split between that many
+    # processes, which read actions from and write results to shared memory, so a step only
+    # sends each worker a short message. Game i is seeded with seed + i.
+    #
+    # The arrays returned are the shared buffers themselves and are overwritten by the next
+    # call; copy them to keep them.
+    def __init__(self, num_envs, seed=None, workers=0, **options):
+        self.num_envs = num_envs
+        seeds = [None if seed is None else seed + index for index in range(num_envs)]
+        self.memory = None
+        self.group = None
+        self.connections = []
+        self.processes = []
+        if workers:
+            self.memory = shared_memory.SharedMemory(create=True, size=vector_buffer_size(num_envs))
+            self.arrays = vector_arrays(self.memory.buf, num_envs)
+            context = multiprocessing.get_context("spawn")
+            for indices in np.array_split(np.arange(num_envs), min(workers, num_envs)):
+                connection, child_connection = context.Pipe()
+                process = context.Process(target=run_worker, daemon=True,
+                                          args=(child_connection, self.memory.name, num_envs, indices.tolist(), seeds,
+                                                options))
+                process.start()
+                child_connection.close()
+                self.connections.append(connection)
+                self.processes.append(process)
+        else:
+            self.arrays = vector_arrays(bytearray(vector_buffer_size(num_envs)), num_envs)
+            self.group = EnvGroup(self.arrays, range(num_envs), seeds, options)
+        self.observations = self.arrays["observations"]
+        self.rewards = self.arrays["rewards"]
+        self.terminated = self.arrays["terminated"]
+        self.truncated = self.arrays["truncated"]
+        self.info = {"scores": self.arrays["scores"], "final_scores": self.arrays["final_scores"]}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def run(self, command, argument=None):
+        if self.group is not None:
+            getattr(self.group, command)(*(() if command == "step" else (argument,)))
+            return
+        for connection in self.connections:
+            connection.send((command, argument))
+        for connection in self.connections:
+            connection.recv()
+
+    def reset(self, seed=None):
+        self.run("reset", None if seed is None else [seed + index for index in range(self.num_envs)])
+        return self.observations, self.info
+
+    def step(self, actions):
+        self.arrays["actions"][:] = actions
+        self.run("step")
+        return self.observations, self.rewards, self.terminated, self.truncated, self.info
+
+    def close(self):
+        if self.group is not None:
+            self.group.close()
+        if self.memory is None:
+            return
+        for connection in self.connections:
+            try:
+                connection.send(("close", None))
+            except OSError:
+                pass
+        for process in self.processes:
+            process.join()
+        self.arrays = self.observations = self.rewards = self.terminated = self.truncated = self.info = None
+        try:
+            self.memory.close()
+        except BufferError:
+            pass  # Arrays handed out are still in use, the mapping goes with the last of them
+        self.memory.unlink()
+        self.memory = None
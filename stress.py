@@ -0,0 +1,277 @@
+# Entity scaling stress test for run3.py. Keeps N extra entities of one kind on screen in a
+# seeded game and measures what Game.update and Game.draw cost as N grows, to find which
+# kinds scale linearly and where the safe spawn caps are.
+#
+#   python stress.py                              # every kind, default sweep
+#   python stress.py monster projectile -n 0 100 1000
+#   python stress.py --budget-ms 8 --csv curves.csv
+import os
+import abc
+import time
+import argparse
+
+import numpy as np
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+import run3
+
+STRESS_SEED = 4321
+STRESS_COUNTS = (0, 25, 50, 100, 200, 400, 800, 1600)
+WARMUP_TICKS = 60  # Ticks before measuring, so caches are warm and pools have filled
+MEASURE_TICKS = 240
+SUPERLINEAR_EXPONENT = 1.2  # Cost growing faster than N**this is reported as worse than linear
+
+class Injector:
+    # Keeps count entities of one kind alive inside the current screen. Topping up happens
+    # between ticks and isn't part of the measured time.
+    def __init__(self, game, count, rng):
+        self.game = game
+        self.count = count
+        self.rng = rng
+
+    def fill(self):
+        self.top_up()
+
+    def top_up(self):
+        pass
+
+class WorldInjector(Injector, metaclass=abc.ABCMeta):
+    # Static level entities, spread over the screen at first and then fed in from the right
+    # edge as the camera scrolls the old ones away. Subclasses say which list they fill and
+    # how to make one entity, and give its broadphase grid if the kind has one.
+    @abc.abstractmethod
+    def entities(self):
+        pass
+
+    def grid(self):
+        return None
+
+    @abc.abstractmethod
+    def make(self, x):
+        pass
+
+    def fill(self):
+        self.injected = []
+        xs = self.game.camera_x + np.sort(self.rng.integers(0, run3.WIDTH, self.count))
+        self.add(xs.tolist())
+
+    def top_up(self):
+        alive = set(map(id, self.entities()))
+        self.injected = [entity for entity in self.injected if id(entity) in alive]
+        missing = self.count - len(self.injected)
+        if missing > 0:
+            self.add([self.game.camera_x + run3.WIDTH] * missing)
+
+    def add(self, xs):
+        entities, grid = self.entities(), self.grid()
+        for x in xs:
+            entity = self.make(x)
+            if grid is None:
+                entities.append(entity)
+            else:
+                self.game.spawn(entities, grid, entity)
+            self.injected.append(entity)
+        # Culling expects each list in x order
+        entities.sort(key=lambda entity: entity.x)
+
+    def random_y(self):
+        return int(self.rng.integers(100, run3.HEIGHT - 100))
+
+class MonsterInjector(WorldInjector):
+    def fill(self):
+        # Room for every shot the extra monsters can have in the air
+        self.game.projectiles = run3.ProjectilePool(run3.PROJECTILE_CAPACITY + self.count * 2)
+        super().fill()
+
+    def entities(self):
+        return self.game.monsters
+
+    def make(self, x):
+        monster = run3.Monster(x, self.random_y())
+        monster.shoot_cooldown = int(self.rng.integers(0, run3.Monster.shoot_delay))
+        return monster
+
+class PowerupInjector(WorldInjector):
+    def entities(self):
+        return self.game.powerups
+
+    def grid(self):
+        return self.game.powerup_grid
+
+    def make(self, x):
+        return run3.Powerup(x, self.random_y())
+
+class SpikeInjector(WorldInjector):
+    def entities(self):
+        return self.game.spikes
+
+    def grid(self):
+        return self.game.spike_grid
+
+    def make(self, x):
+        return run3.Spike(x, self.random_y())
+
+class PlatformInjector(WorldInjector):
+    def entities(self):
+        return self.game.platforms
+
+    def grid(self):
+        return self.game.platform_grid
+
+    def make(self, x):
+        return run3.Platform(x, self.random_y(), int(self.rng.integers(120, 181)), 30)
+
+class ProjectileInjector(Injector):
+    def fill(self):
+        self.game.projectiles = run3.ProjectilePool(run3.PROJECTILE_CAPACITY + self.count)
+        self.top_up()
+
+    def top_up(self):
+        pool = self.game.projectiles
+        camera_x = self.game.camera_x
+        for _ in range(self.count - pool.count):
+            x, target_x = camera_x + self.rng.integers(0, run3.WIDTH, 2)
+            y, target_y = self.rng.integers(0, run3.HEIGHT, 2)
+            pool.spawn(float(x), float(y), float(target_x), float(target_y))
+
+class TrailInjector(Injector):
+    # Meteorites and shooting stars, in a system big enough to hold them all
+    system = None
+    attribute = None
+
+    def fill(self):
+        game = self.game
+        setattr(game, self.attribute, self.system(max(1, self.count) + run3.METEOR_CAPACITY, game.rng, game.fx_rng))
+        self.top_up()
+
+    def top_up(self):
+        system = getattr(self.game, self.attribute)
+        for _ in range(self.count - len(system)):
+            system.spawn(int(self.rng.integers(0, run3.WIDTH)), int(self.rng.integers(-50, run3.HEIGHT // 2)))
+
+class MeteoriteInjector(TrailInjector):
+    system = run3.Meteorites
+    attribute = "meteorites"
+
+class ShootingStarInjector(TrailInjector):
+    system = run3.ShootingStars
+    attribute = "shooting_stars"
+
+class ParticleInjector(Injector):
+    # Particles in the game's general effects layer, particle_system. The player's dash and
+    # landing particles have an engine of their own and aren't part of this.
+    def fill(self):
+        engine = self.game.particle_system
+        self.game.particle_system = run3.ParticleEngine(engine.capacity + self.count, engine.palette, engine.rng)
+        self.top_up()
+
+    def top_up(self):
+        engine = self.game.particle_system
+        missing = self.count - engine.count
+        if missing > 0:
+            rng = self.rng
+            engine.emit(missing, rng.integers(0, run3.WIDTH, missing), rng.integers(0, run3.HEIGHT, missing),
+                        rng.integers(30, 61, missing), vx=rng.uniform(-2, 2, missing), vy=rng.uniform(-2, 2, missing),
+                        size=rng.integers(1, 5, missing), color=rng.integers(0, len(engine.palette), missing))
+
+INJECTORS = {
+    "monster": MonsterInjector,
+    "projectile": ProjectileInjector,
+    "meteorite": MeteoriteInjector,
+    "shooting_star": ShootingStarInjector,
+    "powerup": PowerupInjector,
+    "spike": SpikeInjector,
+    "platform": PlatformInjector,
+    "particle": ParticleInjector,
+}
+
+def measure(kind, count, seed=STRESS_SEED, warmup=WARMUP_TICKS, ticks=MEASURE_TICKS):
+    # Median milliseconds per tick spent in update and in draw with count extra entities.
+    # The median keeps the odd slow tick from drowning out cheap entities.
+    game = run3.Game(headless=True, seed=seed, level_thread=False)
+    game.player.invulnerable = True
+    injector = INJECTORS[kind](game, count, np.random.default_rng(seed))
+    injector.fill()
+    target = run3.pygame.Surface((run3.WIDTH, run3.HEIGHT))
+    times = np.zeros((ticks, 2))
+    for tick in range(warmup + ticks):
+        injector.top_up()
+        start = time.perf_counter()
+        game.step(0, 0)
+        middle = time.perf_counter()
+        game.draw(target)
+        end = time.perf_counter()
+        if tick >= warmup:
+            times[tick - warmup] = middle - start, end - middle
+    game.close()
+    update_ms, draw_ms = np.median(times, axis=0) * 1000
+    return float(update_ms), float(draw_ms)
+
+def growth_exponent(counts, costs, baseline):
+    # Slope of the extra cost against N on a log-log scale, 1 for linear. None with too
+    # few points above the noise.
+    points = [(count, cost - baseline) for count, cost in zip(counts, costs) if count > 0 and cost > baseline]
+    if len(points) < 3:
+        return None
+    n, extra = np.log(np.array(points)).T
+    return float(np.polyfit(n, extra, 1)[0])
+
+def sweep(kind, counts, seed=STRESS_SEED, budget_ms=None):
+    counts = sorted(set(counts) | {0})
+    rows = []
+    for count in counts:
+        update_ms, draw_ms = measure(kind, count, seed)
+        rows.append((count, update_ms, draw_ms))
+    base_update, base_draw = rows[0][1], rows[0][2]
+
+    print(f"\n{kind}")
+    print(f"{'N':>6}{'update ms':>11}{'draw ms':>10}{'update us/N':>13}{'draw us/N':>11}")
+    for count, update_ms, draw_ms in rows:
+        if count:
+            per_update = f"{(update_ms - base_update) * 1000 / count:>13.2f}"
+            per_draw = f"{(draw_ms - base_draw) * 1000 / count:>11.2f}"
+        else:
+            per_update, per_draw = f"{'':>13}", f"{'':>11}"
+        print(f"{count:>6}{update_ms:>11.3f}{draw_ms:>10.3f}{per_update}{per_draw}")
+
+    summary = []
+    for label, column, baseline in (("update", 1, base_update), ("draw", 2, base_draw)):
+        exponent = growth_exponent(counts, [row[column] for row in rows], baseline)
+        if exponent is None:
+            summary.append(f"{label} too cheap to fit")
+        else:
+            shape = "worse than linear" if exponent > SUPERLINEAR_EXPONENT else "linear"
+            summary.append(f"{label} ~N^{exponent:.2f} ({shape})")
+    print("  " + ", ".join(summary))
+    if budget_ms is not None:
+        fits = [count for count, update_ms, draw_ms in rows if update_ms + draw_ms <= budget_ms]
+        print(f"  largest N within {budget_ms} ms per frame: {max(fits) if fits else 'none'}")
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Run 3 entity scaling stress test")
+    parser.add_argument("kinds", nargs="*", metavar="KIND", help=f"entity kinds to sweep, default all of: "
+                                                                 f"{', '.join(INJECTORS)}")
+    parser.add_argument("-n", "--counts", type=int, nargs="+", default=STRESS_COUNTS, help="values of N to measure")
+    parser.add_argument("--seed", type=int, default=STRESS_SEED)
+    parser.add_argument("--budget-ms", type=float, help="report the largest N whose update and draw fit in this")
+    parser.add_argument("--csv", metavar="FILE", help="also write every measurement to a CSV file")
+    args = parser.parse_args()
+    for kind in args.kinds:
+        if kind not in INJECTORS:
+            parser.error(f"unknown kind {kind!r}, choose from {', '.join(INJECTORS)}")
+
+    run3.init(headless=True)
+    results = {}
+    for kind in args.kinds or INJECTORS:
+        results[kind] = sweep(kind, args.counts, args.seed, args.budget_ms)
+
+    if args.csv:
+        with open(args.csv, "w") as csv:
+            csv.write("kind,n,update_ms,draw_ms\n")
+            for kind, rows in results.items():
+                for count, update_ms, draw_ms in rows:
+                    csv.write(f"{kind},{count},{update_ms:.4f},{draw_ms:.4f}\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+# Monte Carlo difficulty tuning for run3.py. Plays many seeded headless games with scripted
+# bots across a process pool and reports score and death cause distributions for every
+# combination of the constants being swept.
+#
+#   python tune.py --games 500
+#   python tune.py --policy greedy lookahead --set MONSTER_CHANCE=0.15,0.25,0.35 --set POWERUP_CHANCE=0.1,0.2
+#   python tune.py --games 2000 --workers 16 --json sweep.json
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import multiprocessing
+
+import numpy as np
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+import run3
+
+TUNE_SEED = 1000
+TUNE_GAMES = 200  # Games per policy and parameter combination
+TUNE_MAX_TICKS = 5 * 60 * run3.TICK_RATE  # Games still going after five minutes count as timeouts
+DEATH_CAUSES = ("spike", "projectile", "fall", "ceiling", "timeout")
+# run3 constants the game reads while it plays, so setting them between games changes what
+# happens. Everything else is read once at import, only changes drawing or isn't used.
+# SPACESHIP_SPEED and SPACESHIP_DISTANCE aren't here: a boarded spaceship doesn't carry the
+# player, so they only change how it flies off.
+SWEEPABLE = ("MONSTER_CHANCE", "POWERUP_CHANCE", "SPIKE_CHANCE", "SPACESHIP_CHANCE", "MONSTER_START_SCORE",
+             "SPACESHIP_SPACING_TICKS", "SCROLL_SPEED", "MOVE_SPEED", "GRAVITY", "JUMP_FORCE", "DASH_COOLDOWN",
+             "PROJECTILE_CAPACITY")
+
+class Bot:
+    # Picks the input bits for each tick, as Game.step takes them
+    def __init__(self, seed):
+        self.rng = np.random.default_rng(seed)
+
+    def act(self, game):
+        return 0, 0
+
+class RandomBot(Bot):
+    # Wanders and mashes keys
+    def __init__(self, seed):
+        super().__init__(seed)
+        self.held = 0
+
+    def act(self, game):
+        rng = self.rng
+        if game.frame % 30 == 0:
+            self.held = (0, run3.INPUT_LEFT, run3.INPUT_RIGHT)[rng.integers(3)]
+        pressed = 0
+        if rng.random() < 0.05:
+            pressed |= run3.INPUT_SPACE
+        if rng.random() < 0.01:
+            pressed |= run3.INPUT_LSHIFT
+        return self.held, pressed
+
+class GreedyBot(Bot):
+    # Stands still and jumps at the last moment for gaps, spikes and incoming shots
+    gap_lookahead = 40
+    spike_lookahead = 60
+    shot_distance = 80
+
+    def act(self, game):
+        player = game.player
+        if player.is_jumping:
+            return 0, 0
+        x = game.camera_x + player.x
+        feet = player.y + player.height
+        ahead = x + player.width + self.gap_lookahead
+        # A gap is no platform top between the feet and a little below them just ahead
+        gap = not any(feet - 5 <= platform.y <= feet + 150 for platform in game.platform_grid.query(ahead, ahead))
+        spike = any(0 < spike.x - x < self.spike_lookahead and spike.y < feet + 5
+                    for spike in game.spike_grid.query(x, x + player.width + self.spike_lookahead))
+        pool = game.projectiles
+        count = pool.count
+        shot = count and np.any(np.hypot(pool.x[:count] - x - player.width / 2,
+                                         pool.y[:count] - player.y - player.height / 2) < self.shot_distance)
+        return 0, run3.INPUT_SPACE if gap or spike or shot else 0
+
+class LookaheadBot(Bot):
+    # Simulates a simple model of the player for every move and jump choice over the next
+    # horizon ticks and takes the one that survives longest, re-planning every few ticks
+    horizon = 60
+    plan_every = 3
+    moves = (0, run3.INPUT_LEFT, run3.INPUT_RIGHT)
+
+    def __init__(self, seed):
+        super().__init__(seed)
+        self.held = 0
+
+    def act(self, game):
+        if game.frame % self.plan_every:
+            return self.held, 0
+        player = game.player
+        camera_x = game.camera_x
+        reach = self.horizon * (game.scroll_speed + run3.MOVE_SPEED) + player.width
+        left = camera_x + player.x - self.horizon * run3.MOVE_SPEED
+        platforms = game.platform_grid.query(left, camera_x + player.x + reach)
+        spikes = game.spike_grid.query(left, camera_x + player.x + reach)
+        # Shots in screen space for every future tick, shape (horizon, shots)
+        pool = game.projectiles
+        count = pool.count
+        steps = np.arange(1, self.horizon + 1)[:, None]
+        shots_x = pool.x[:count] - camera_x + pool.vx[:count] * steps
+        shots_y = pool.y[:count] + pool.vy[:count] * steps
+        # Shots monsters will fire within the horizon: (tick, world x, y) of each
+        volleys = []
+        for monster in game.monsters:
+            tick = max(monster.shoot_cooldown - 1, 0)
+            while tick < self.horizon:
+                volleys.append((tick, monster.x + monster.width / 2, monster.y + monster.height / 2))
+                tick += monster.shoot_delay
+
+        best = None
+        for jump in ((False, True) if not player.is_jumping else (False,)):
+            for held in self.moves:
+                survived, drift = self.simulate(game, player, held, jump, platforms, spikes, shots_x, shots_y,
+                                                volleys)
+                # Survive longest, then avoid jumping for nothing, then stay near the start column
+                key = (survived, not jump, -abs(drift - run3.WIDTH // 4))
+                if best is None or key > best[0]:
+                    best = (key, held, jump)
+        _, self.held, jump = best
+        return self.held, run3.INPUT_SPACE if jump else 0
+
+    def simulate(self, game, player, held, jump, platforms, spikes, shots_x, shots_y, volleys):
+        # Ticks survived and the final screen x. Gravity, landing, spikes, shots in the air
+        # and shots aimed along this path, wall runs and the screen edges are modelled;
+        # dashes aren't.
+        x, y, vel_y = player.x, player.y, player.vel_y
+        width, height = player.width, player.height
+        if jump:
+            vel_y = run3.JUMP_FORCE * 1.5 if player.has_jump_powerup else run3.JUMP_FORCE
+        step = -run3.MOVE_SPEED if held == run3.INPUT_LEFT else run3.MOVE_SPEED if held == run3.INPUT_RIGHT else 0
+        xs = np.empty(self.horizon)
+        ys = np.empty(self.horizon)
+        alive = self.horizon
+        for tick in range(self.horizon):
+            camera_x = game.camera_x + game.scroll_speed * (tick + 1)
+            x = min(max(x + step, 0), run3.WIDTH - width)
+            vel_y += run3.GRAVITY
+            y += vel_y
+            world_x = x + camera_x
+            wall_run = False
+            for platform in platforms:
+                if (world_x < platform.x + platform.width and world_x + width > platform.x and
+                        y + height > platform.y and y < platform.y + platform.height):
+                    if vel_y > 0:
+                        y = platform.y - height
+                        vel_y = 0
+                    elif vel_y < 0:
+                        y = platform.y + platform.height
+                        vel_y = 0
+            for platform in platforms:
+                # Falling against a platform's side starts a wall run, which only ends at
+                # the top or bottom of the screen, so the model counts it as a death
+                if (vel_y > 0 and y < platform.y + platform.height and y + height > platform.y and
+                        (world_x < platform.x < world_x + width or
+                         world_x < platform.x + platform.width < world_x + width)):
+                    wall_run = True
+            xs[tick] = x
+            ys[tick] = y
+            if wall_run or y > run3.HEIGHT or y < -height or any(world_x < spike.x + spike.width and world_x + width > spike.x and
+                                      y + height > spike.y and y < spike.y + spike.height for spike in spikes):
+                alive = tick
+                break
+        if shots_x.shape[1]:
+            radius = run3.ProjectilePool.radius
+            hit = ((shots_x[:alive] + radius > xs[:alive, None]) & (shots_x[:alive] - radius < xs[:alive, None] + width) &
+                   (shots_y[:alive] + radius > ys[:alive, None]) & (shots_y[:alive] - radius < ys[:alive, None] + height))
+            hit_ticks = np.flatnonzero(hit.any(axis=1))
+            if len(hit_ticks):
+                alive = int(hit_ticks[0])
+        radius = run3.ProjectilePool.radius
+        speed = run3.ProjectilePool.speed
+        for fired, monster_x, monster_y in volleys:
+            if fired >= alive:
+                continue
+            # Monsters aim at where the player was at the end of the previous tick
+            start_x = monster_x - (game.camera_x + game.scroll_speed * (fired + 1))
+            aim_x = (xs[fired - 1] if fired else player.x) + width / 2 - start_x
+            aim_y = (ys[fired - 1] if fired else player.y) + height / 2 - monster_y
+            distance = np.hypot(aim_x, aim_y)
+            if distance == 0:
+                continue
+            ticks = np.arange(fired, alive)
+            shot_x = start_x + aim_x / distance * speed * (ticks - fired + 1)
+            shot_y = monster_y + aim_y / distance * speed * (ticks - fired + 1)
+            hit = np.flatnonzero((shot_x + radius > xs[ticks]) & (shot_x - radius < xs[ticks] + width) &
+                                 (shot_y + radius > ys[ticks]) & (shot_y - radius < ys[ticks] + height))
+            if len(hit):
+                alive = int(ticks[hit[0]])
+        return alive, xs[max(alive - 1, 0)]
+
+POLICIES = {
+    "random": RandomBot,
+    "greedy": GreedyBot,
+    "lookahead": LookaheadBot,
+}
+
+def play(job):
+    # One game in a worker process. The swept constants are set on the module each time,
+    # every job sets the same names so nothing carries over between jobs.
+    overrides, policy, seed, max_ticks = job
+    for name, value in overrides:
+        setattr(run3, name, value)
+    game = run3.Game(headless=True, seed=seed, level_thread=False, effects=False)
+    bot = POLICIES[policy](seed)
+    while game.player.is_alive and game.frame < max_ticks:
+        held, pressed = bot.act(game)
+        game.step(held, pressed)
+    game.close()
+    cause = game.player.death_cause if not game.player.is_alive else "timeout"
+    return overrides, policy, game.score, game.frame, cause
+
+def parse_sweep(assignments):
+    # ["NAME=1,2", ...] to a list of override tuples, one per combination
+    names, choices = [], []
+    for assignment in assignments:
+        name, _, values = assignment.partition("=")
+        if name not in SWEEPABLE or not values:
+            raise ValueError(f"can't sweep {assignment!r}, expected NAME=V1,V2 with NAME one of {', '.join(SWEEPABLE)}")
+        numbers = [float(value) for value in values.split(",")]
+        if type(getattr(run3, name)) is int:
+            for value, number in zip(values.split(","), numbers):
+                if not number.is_integer():
+                    raise ValueError(f"{name} takes whole numbers, got {value!r}")
+            numbers = [int(number) for number in numbers]
+        names.append(name)
+        choices.append(numbers)
+    return [tuple(zip(names, combination)) for combination in itertools.product(*choices)]
+
+def summarize(results):
+    # Score, survival and death cause distributions per (overrides, policy)
+    groups = {}
+    for overrides, policy, score, ticks, cause in results:
+        groups.setdefault((overrides, policy), []).append((score, ticks, cause))
+    report = []
+    for (overrides, policy), games in sorted(groups.items()):
+        scores = np.array([game[0] for game in games])
+        ticks = np.array([game[1] for game in games])
+        causes = [game[2] for game in games]
+        p10, p50, p90 = np.percentile(scores, (10, 50, 90))
+        report.append({
+            "config": dict(overrides),
+            "policy": policy,
+            "games": len(games),
+            "score": {"mean": round(float(scores.mean()), 1), "p10": float(p10), "p50": float(p50),
+                      "p90": float(p90), "max": int(scores.max())},
+            "seconds_survived": round(float(ticks.mean()) / run3.TICK_RATE, 2),
+            "deaths": {cause: round(causes.count(cause) / len(games), 3) for cause in DEATH_CAUSES},
+        })
+    return report
+
+def print_report(report):
+    print(f"{'config':<36}{'policy':<11}{'games':>6}{'mean':>8}{'p10':>7}{'p50':>7}{'p90':>7}{'secs':>7}"
+          + "".join(f"{cause:>11}" for cause in DEATH_CAUSES))
+    for row in report:
+        config = " ".join(f"{name}={value}" for name, value in row["config"].items()) or "defaults"
+        score = row["score"]
+        print(f"{config:<36}{row['policy']:<11}{row['games']:>6}{score['mean']:>8.1f}{score['p10']:>7.0f}"
+              f"{score['p50']:>7.0f}{score['p90']:>7.0f}{row['seconds_survived']:>7.1f}"
+              + "".join(f"{row['deaths'][cause]:>11.1%}" for cause in DEATH_CAUSES))
+
+def main():
+    parser = argparse.ArgumentParser(description="Run 3 difficulty tuning with bots")
+    parser.add_argument("--games", type=int, default=TUNE_GAMES, help="games per policy and parameter combination")
+    parser.add_argument("--policy", nargs="+", default=list(POLICIES), help=f"bots to use: {', '.join(POLICIES)}")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=V1,V2",
+                        help=f"sweep a run3 constant over these values, can be repeated. NAME is one of "
+                             f"{', '.join(SWEEPABLE)}")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--seed", type=int, default=TUNE_SEED, help="first game seed")
+    parser.add_argument("--max-ticks", type=int, default=TUNE_MAX_TICKS, help="stop a game after this many ticks")
+    parser.add_argument("--json", metavar="FILE", help="also write the report as JSON")
+    args = parser.parse_args()
+    for policy in args.policy:
+        if policy not in POLICIES:
+            parser.error(f"unknown policy {policy!r}, choose from {', '.join(POLICIES)}")
+    try:
+        sweep = parse_sweep(args.set)
+    except ValueError as error:
+        parser.error(str(error))
+
+    # Every combination plays the same seeds, so differences come from the settings, not the levels
+    jobs = [(overrides, policy, args.seed + game, args.max_ticks)
+            for overrides in sweep for policy in args.policy for game in range(args.games)]
+    results = []
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.workers) as pool:
+        for result in pool.imap_unordered(play, jobs, chunksize=max(1, len(jobs) // (args.workers * 16))):
+            results.append(result)
+            if len(results) % 100 == 0 or len(results) == len(jobs):
+                print(f"\r{len(results)}/{len(jobs)} games", end="", file=sys.stderr)
+    elapsed = time.perf_counter() - start
+    print(f"\n{len(jobs)} games in {elapsed:.1f}s ({len(jobs) / elapsed:.1f} games/s)", file=sys.stderr)
+
+    report = summarize(results)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(report, output, indent=2)
+
+if __name__ == "__main__":
+    main()